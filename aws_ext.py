@@ -1,155 +1,1390 @@
-from pyrsistent import v
-import yaml
+from __future__ import annotations
 import json
 import re
+import copy
+import hashlib
+import asyncio
+import html
+import importlib
 import logging
+import atexit
+import queue
 import sys
+import warnings
 from abc import ABC, abstractmethod
-from time import sleep
-import boto3 
-from cfn_flip import flip, to_yaml, to_json
-import ipywidgets as widgets
+import threading
+import weakref
+from functools import lru_cache, partial, wraps
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import tempfile
+import glob
+from time import monotonic, time
 from IPython.core.magic import Magics, line_magic, magics_class
-from IPython.display import display
+from IPython.display import display, HTML
 
 import os
-from logging import getLogger, StreamHandler, DEBUG, INFO, Formatter, FileHandler
+from logging import getLogger, DEBUG, Formatter, NullHandler
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 APP_BASE_DIR=os.path.join(os.environ["HOME"], ".aws-cfn-nb-extensions")
 LOG_BASE_DIR=os.path.join(APP_BASE_DIR, "log")
 HTML_BASE_DIR=os.path.join(APP_BASE_DIR, "html")
-os.makedirs(LOG_BASE_DIR, exist_ok=True)
-os.makedirs(HTML_BASE_DIR, exist_ok=True)
+CACHE_BASE_DIR=os.path.join(APP_BASE_DIR, "cache")
+
+# level of the log file, overridden by the environment variable or `%cfn_log_level`
+LOG_LEVEL = os.environ.get("AWS_CFN_NB_EXTENSIONS_LOG_LEVEL", "INFO").upper()
+if not isinstance(logging.getLevelName(LOG_LEVEL), int):
+    warnings.warn(f"unknown log level in AWS_CFN_NB_EXTENSIONS_LOG_LEVEL : {LOG_LEVEL}, INFO is used instead")
+    LOG_LEVEL = "INFO"
+# size in bytes at which the log file is rotated
+LOG_MAX_BYTES = 10 * 1024 * 1024
+# number of rotated log files kept
+LOG_BACKUP_COUNT = 5
 
-verbose = True
 logger = getLogger(__file__)
-handler = FileHandler(os.path.join(LOG_BASE_DIR, "aws-cfn-nb-extensions.log"))
-if verbose:
-    handler.setLevel(DEBUG)
-else:
-    handler.setLevel(INFO)
-handler.setFormatter(Formatter("%(asctime)s %(name)s:%(lineno)s %(funcName)s [%(levelname)s]: %(message)s"))
-logger.addHandler(handler)
-logger.setLevel(DEBUG)
+# records are dropped until initialize() attaches the log file
+logger.addHandler(NullHandler())
+logger.setLevel(LOG_LEVEL)
 logger.propagate = False
 
 
-
-def name_tag_getter():
-    vpcs = dict()
-    instances = dict()
-    subnets = dict()
-    volumes = dict()
-    def get_name_tag(tags, default:str=""):
-        name = [tag["Value"] for tag in tags if tag["Key"] == "Name"]
+class LazyModule:
+    """
+    stand-in for a module imported on first attribute access
+    - keeps `%load_ext aws_ext` from importing boto3, ipywidgets, cfn_flip and yaml
+    - once imported, the module replaces the stand-in in this module's globals
+    """
+
+    def __init__(self, name:str, alias:str=None) -> None:
+        self._name = name
+        self._alias = alias or name
+
+    def __getattr__(self, attr:str):
+        module = importlib.import_module(self._name)
+        globals()[self._alias] = module
+        return getattr(module, attr)
+
+boto3 = LazyModule("boto3")
+widgets = LazyModule("ipywidgets", "widgets")
+cfn_flip = LazyModule("cfn_flip")
+yaml = LazyModule("yaml")
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    hands records to the log listener's thread as they are
+    - messages are formatted by the listener, off the kernel thread
+    - arguments of records must not be mutated after logging
+    """
+
+    def prepare(self, record:logging.LogRecord) -> logging.LogRecord:
+        return record
+
+def set_log_level(level:str) -> str:
+    # records below the level are dropped before their messages are formatted
+    logger.setLevel(level.upper())
+    return logging.getLevelName(logger.level)
+
+_initialized_pid = None
+_log_listener = None
+def initialize():
+    """
+    set up directories and the log file, deferred from import to the first magic call
+    """
+    global _initialized_pid, _log_listener
+    if _initialized_pid == os.getpid():
+        return
+    _initialized_pid = os.getpid()
+    # forked worker processes inherit the handler, but not the listener thread consuming its queue
+    for handler in [h for h in logger.handlers if isinstance(h, DeferredQueueHandler)]:
+        logger.removeHandler(handler)
+    os.makedirs(LOG_BASE_DIR, exist_ok=True)
+    os.makedirs(HTML_BASE_DIR, exist_ok=True)
+    os.makedirs(CACHE_BASE_DIR, exist_ok=True)
+    # the file is written by a listener thread, so logging never blocks on disk
+    handler = RotatingFileHandler(
+        os.path.join(LOG_BASE_DIR, "aws-cfn-nb-extensions.log"),
+        maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding="utf-8",
+    )
+    handler.setFormatter(Formatter("%(asctime)s %(name)s:%(lineno)s %(funcName)s [%(levelname)s]: %(message)s"))
+    log_queue = queue.SimpleQueue()
+    _log_listener = QueueListener(log_queue, handler)
+    _log_listener.start()
+    atexit.register(_log_listener.stop)
+    logger.addHandler(DeferredQueueHandler(log_queue))
+
+def flush_log():
+    # write queued records now, as worker processes exit without running atexit
+    if _log_listener is not None:
+        _log_listener.stop()
+        _log_listener.start()
+
+# seconds for which aws resource listings are reused before being fetched again
+INVENTORY_TTL = 300
+# minimum seconds between pushes of newly listed options to a widget
+OPTIONS_FLUSH_INTERVAL = 0.5
+# maximum number of aws list calls run concurrently when prefetching inventories
+PREFETCH_MAX_WORKERS = 8
+# size of the http connection pool of each pooled boto3 client
+CLIENT_MAX_POOL_CONNECTIONS = 20
+# get_parameters accepts at most 10 names per call
+SSM_GET_PARAMETERS_BATCH_SIZE = 10
+# maximum number of get_parameters calls run concurrently
+SSM_GET_PARAMETERS_MAX_WORKERS = 4
+# ec2 filters accept at most 200 values, so describe_tags looks up this many resource ids per call
+DESCRIBE_TAGS_BATCH_SIZE = 200
+# total bytes of inventory listings kept on disk before the least recently used are evicted
+CACHE_MAX_BYTES = 100 * 1024 * 1024
+# seconds for which save results are shown under the save button
+STATUS_MESSAGE_SECONDS = 5
+# prefix of environment variables overriding parameter values in headless generation
+PARAMETER_ENV_PREFIX = "CFN_PARAMETER_"
+# seconds to wait after the last change of a widget before validating its value
+VALIDATION_DEBOUNCE_SECONDS = 0.3
+# max number of options sent to the browser for a widget, the others are reached by searching
+SEARCH_MAX_OPTIONS = 100
+# seconds to wait after the last key stroke in a search box before searching
+SEARCH_DEBOUNCE_SECONDS = 0.3
+# resources which can grow to thousands of items. they are not prefetched, and widgets stop listing
+# them after SEARCH_MAX_OPTIONS items and look for the others on aws with filters
+SEARCH_RESOURCES = ["instances", "volumes", "ssm_parameters", "ssm_parameter_values"]
+# resources listed within a single vpc, filtered on vpc-id, once a vpc parameter they depend on is chosen
+VPC_SCOPED_RESOURCES = ["subnets", "security_groups"]
+# max number of spans recorded per run for `%cfn_profile`
+TRACE_MAX_SPANS = 10000
+# top-level sections of yaml templates constructed, the others are skipped without being built
+TEMPLATE_SECTIONS = ("Parameters", "Rules")
+
+
+class Tracer:
+    """
+    records timed spans of the last magic run for `%cfn_profile`
+    - a span is a phase or an aws call, with its start, duration, thread and attributes
+      such as page count, item count and cache hit/miss
+    - spans of work still running in the background after the magic returns belong to the same run
+    """
+
+    def __init__(self, max_spans:int=TRACE_MAX_SPANS) -> None:
+        self.max_spans = max_spans
+        self.run_name = None
+        self.started_at = None
+        self.origin = None
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def start_run(self, run_name:str):
+        with self._lock:
+            self.run_name = run_name
+            self.started_at = time()
+            self.origin = monotonic()
+            self.spans = []
+
+    @contextmanager
+    def span(self, name:str, category:str, **attributes):
+        """
+        time the block as a span, attributes can be added to the yielded dict within it
+        """
+        started = monotonic()
         try:
-            return name[0]
-        except IndexError:
-            return default
-
-    def get_vpc_name(vpc_id:str, client:boto3.client) -> str:
+            yield attributes
+        except GeneratorExit:
+            # a generator was closed before its end, which is not a failure
+            attributes["closed"] = True
+            raise
+        except BaseException as ex:
+            attributes["error"] = type(ex).__name__
+            raise
+        finally:
+            self.record(name, category, started, monotonic() - started, attributes)
+
+    def record(self, name:str, category:str, started:float, duration:float, attributes:dict):
+        with self._lock:
+            if self.origin is None or len(self.spans) >= self.max_spans:
+                return
+            self.spans.append(dict(
+                name=name, category=category, start=started - self.origin, duration=duration,
+                thread=threading.current_thread().name, attributes=dict(attributes),
+            ))
+
+    def export(self) -> dict:
+        with self._lock:
+            spans = sorted(self.spans, key=lambda span: span["start"])
+            return dict(run=self.run_name, started_at=self.started_at, spans=spans)
+
+tracer = Tracer()
+
+def traced(magic):
+    # each call of the magic starts a new run of the tracer
+    @wraps(magic)
+    def traced_magic(self, line):
+        initialize()
+        tracer.start_run(f"%{magic.__name__} {line}".strip())
+        with tracer.span(magic.__name__, "magic"):
+            return magic(self, line)
+    return traced_magic
+
+def _aws_call_name(event_name:str) -> str:
+    # `after-call.ec2.DescribeKeyPairs` to `ec2.DescribeKeyPairs`
+    return ".".join((event_name or "").split(".")[1:]) or "unknown"
+
+def _trace_aws_call_start(context:dict, model=None, event_name:str=None, **kwargs):
+    context["trace_started_at"] = monotonic()
+    context["trace_name"] = _aws_call_name(event_name) if model is None else f"{model.service_model.service_name}.{model.name}"
+
+def _record_aws_call(context:dict, event_name:str, attributes:dict):
+    # trace hooks run inside botocore's calls, so they must never raise in place of the call's own error
+    try:
+        started = context.get("trace_started_at")
+        if started is None:
+            return
+        attributes["region"] = context.get("client_region")
+        name = context.get("trace_name") or _aws_call_name(event_name)
+        tracer.record(name, "aws", started, monotonic() - started, attributes)
+    except Exception as ex:
+        logger.debug("failed to trace aws call %s : %s", event_name, ex)
+
+def _trace_aws_call_end(context:dict, parsed:dict=None, event_name:str=None, **kwargs):
+    attributes = dict()
+    if isinstance(parsed, dict):
+        attributes["items"] = sum(len(value) for value in parsed.values() if isinstance(value, list))
+        attributes["next_page"] = any(key in parsed for key in ("NextToken", "NextMarker"))
+    _record_aws_call(context, event_name, attributes)
+
+def _trace_aws_call_error(context:dict, exception:Exception=None, event_name:str=None, **kwargs):
+    # botocore sends after-call-error with only the exception and the context
+    _record_aws_call(context, event_name, dict(error=type(exception).__name__))
+
+def trace_aws_calls(session:boto3.session.Session):
+    # every api call of clients created from the session afterwards is recorded as a span
+    session.events.register("before-parameter-build", _trace_aws_call_start, unique_id="aws-cfn-nb-extensions-trace-start")
+    session.events.register("after-call", _trace_aws_call_end, unique_id="aws-cfn-nb-extensions-trace-end")
+    session.events.register("after-call-error", _trace_aws_call_error, unique_id="aws-cfn-nb-extensions-trace-error")
+
+
+
+class AwsClientPool:
+    """
+    thread-safe pool of boto3 clients shared by all parameter classes
+    - clients are keyed by (service, region, profile) and created lazily on first use
+    - profile None means boto3's default session
+    """
+
+    def __init__(self, max_pool_connections:int=CLIENT_MAX_POOL_CONNECTIONS) -> None:
+        self.max_pool_connections = max_pool_connections
+        self._sessions = dict()
+        self._clients = dict()
+        # profile each pooled client has been created with
+        self._client_profiles = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def _get_session(self, profile:str=None) -> boto3.session.Session:
         try:
-            return vpcs[vpc_id]
+            return self._sessions[profile]
         except KeyError:
-            resp = client.describe_vpcs()
-            for vpc in resp["Vpcs"]:
-                vid = vpc["VpcId"]
-                try:
-                    tags = vpc["Tags"]
-                except KeyError:
-                    vpcs[vid] = vid
-                    continue
-                vpcs[vid] = get_name_tag(tags, vid)
-
-            return vpcs[vpc_id]
+            pass
+        if profile is None:
+            if boto3.DEFAULT_SESSION is None:
+                boto3.setup_default_session()
+            session = boto3.DEFAULT_SESSION
+        else:
+            session = boto3.session.Session(profile_name=profile)
+        trace_aws_calls(session)
+        self._sessions[profile] = session
+        return session
+
+    def get_session(self, profile:str=None) -> boto3.session.Session:
+        with self._lock:
+            return self._get_session(profile)
+
+    def get_client(self, service:str, region:str=None, profile:str=None) -> boto3.client:
+        # boto3 sessions are not thread-safe, so clients are created under the lock
+        with self._lock:
+            session = self._get_session(profile)
+            key = (service, region or session.region_name, profile)
+            try:
+                return self._clients[key]
+            except KeyError:
+                pass
+            logger.debug("create client : %s", key)
+            import botocore.config
+            with tracer.span(f"client {service}", "client", region=key[1], profile=profile):
+                client = session.client(
+                    service, region_name=key[1],
+                    config=botocore.config.Config(max_pool_connections=self.max_pool_connections),
+                )
+            self._clients[key] = client
+            self._client_profiles[client] = profile
+            return client
+
+    def profile_of(self, client:boto3.client) -> str:
+        return self._client_profiles.get(client)
+
+    def available_profiles(self) -> list:
+        return list(self.get_session().available_profiles)
+
+    def available_regions(self, profile:str=None) -> list:
+        # regions known to botocore's endpoint data, no api call is made
+        return self.get_session(profile).get_available_regions("ec2")
+
+    def default_region(self, profile:str=None) -> str:
+        return self.get_session(profile).region_name
+
+    def set_max_pool_connections(self, max_pool_connections:int):
+        # pooled clients keep their connection pool size, so drop them to be recreated
+        with self._lock:
+            self.max_pool_connections = max_pool_connections
+            self._clients.clear()
+
+    def clear(self):
+        with self._lock:
+            self._clients.clear()
+            self._sessions.clear()
+
+client_pool = AwsClientPool()
+
+
+class InventoryEntry:
+    def __init__(self, items:list, fetched_at:float, stale:bool=False, complete:bool=True) -> None:
+        self.items = items
+        self.fetched_at = fetched_at
+        # loaded from the disk cache and served until it is revalidated
+        self.stale = stale
+        # False if the listing has been cut short, the others are left to search
+        self.complete = complete
+
+
+class DiskInventoryCache:
+    """
+    inventory listings persisted across kernel restarts
+    - one json file per (account id, region, resource type) under `cache_dir`, which holds the key as well
+      since file names are sanitized
+    - least recently used files are evicted once their total size exceeds `max_bytes`
+    """
+
+    def __init__(self, cache_dir:str, max_bytes:int=CACHE_MAX_BYTES) -> None:
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def _path(self, key:tuple) -> str:
+        name = "__".join(re.sub(r"[^\w.-]", "_", str(part)) for part in key)
+        return os.path.join(self.cache_dir, f"{name}.json")
+
+    def _files(self) -> list:
+        try:
+            names = os.listdir(self.cache_dir)
+        except FileNotFoundError:
+            return []
+        return [os.path.join(self.cache_dir, name) for name in names if name.endswith(".json")]
 
-    def get_instance_name(instance_id:str, client:boto3.client) -> str:
+    def load(self, key:tuple) -> InventoryEntry:
+        path = self._path(key)
         try:
-            return instances[instance_id]
-        except KeyError:
-            resp = client.describe_instances()
-            for reservation in resp["Reservations"]:
-                for instance in reservation["Instances"]:
-                    iid = instance["InstanceId"]
-                    try:
-                        tags = instance["Tags"]
-                    except KeyError:
-                        instance[iid] = iid
-                        continue
-                    instances[iid] = get_name_tag(tags, iid)
-
-            return instances[instance_id]
-    def get_subnet_name(subnet_id:str, client:boto3.client) -> str:
+            with open(path, "r", encoding="utf-8") as fp:
+                body = json.load(fp)
+            if not isinstance(body["items"], list):
+                raise TypeError(f"items must be a list, not {type(body['items']).__name__}")
+            entry = InventoryEntry(body["items"], float(body["fetched_at"]), complete=body.get("complete", True))
+        except FileNotFoundError:
+            return None
+        except OSError as ex:
+            logger.warning("failed to load inventory cache %s : %s", path, ex)
+            return None
+        except (ValueError, KeyError, TypeError) as ex:
+            # corrupted or written by another version, so it is a miss and is listed again
+            logger.warning("remove invalid inventory cache %s : %s", path, ex)
+            self._remove(path)
+            return None
+        # mark as recently used for eviction
         try:
-            return subnets[subnet_id]
-        except KeyError:
-            resp = client.describe_subnets()
-            for subnet in resp["Subnets"]:
-                sid = subnet["SubnetId"]
+            os.utime(path)
+        except OSError:
+            pass
+        return entry
+
+    def save(self, key:tuple, entry:InventoryEntry):
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as fp:
+                json.dump(dict(key=key, fetched_at=entry.fetched_at, complete=entry.complete, items=entry.items), fp, default=str)
+            os.replace(tmp_path, path)
+        except OSError as ex:
+            logger.warning("failed to save inventory cache %s : %s", path, ex)
+            return
+        self.evict()
+
+    def evict(self):
+        with self._lock:
+            files = []
+            for path in self._files():
                 try:
-                    tags = subnet["Tags"]
-                except KeyError:
-                    subnets[sid] = sid
+                    stat = os.stat(path)
+                except FileNotFoundError:
                     continue
-                subnets[sid] = get_name_tag(tags, sid)
+                files.append((stat.st_mtime, stat.st_size, path))
+            total = sum(size for _, size, _ in files)
+            for _, size, path in sorted(files):
+                if total <= self.max_bytes:
+                    break
+                logger.debug("evict inventory cache : %s", path)
+                self._remove(path)
+                total -= size
+
+    def _remove(self, path:str) -> bool:
+        try:
+            os.remove(path)
+            return True
+        except FileNotFoundError:
+            return False
 
-            return subnets[subnet_id]
-    def get_volume_name(volume_id:str, client:boto3.client) -> str:
+    def _key_of(self, path:str) -> tuple:
         try:
-            return volumes[volume_id]
-        except KeyError:
-            resp = client.describe_volumes()
-            for volume in resp["Volumes"]:
-                vid = volume["VolumeId"]
-                try:
-                    tags = volume["Tags"]
-                except KeyError:
-                    volumes[vid] = vid
-                    continue
-                volumes[vid] = get_name_tag(tags, vid)
-            return volumes[volume_id]
+            with open(path, "r", encoding="utf-8") as fp:
+                return tuple(json.load(fp)["key"])
+        except (OSError, ValueError, KeyError, TypeError):
+            # files saved without the key are matched by their names
+            return tuple(os.path.basename(path)[:-len(".json")].split("__"))
+
+    def remove(self, matches) -> int:
+        # remove cached files whose key satisfies `matches(key)`
+        removed = 0
+        for path in self._files():
+            if matches(self._key_of(path)) and self._remove(path):
+                removed += 1
+        return removed
+
+    def purge(self) -> int:
+        removed = 0
+        try:
+            names = os.listdir(self.cache_dir)
+        except FileNotFoundError:
+            return 0
+        for name in names:
+            if name.endswith(".json") or name.endswith(".tmp"):
+                if self._remove(os.path.join(self.cache_dir, name)):
+                    removed += 1
+        return removed
+
+
+def _paginate(client:boto3.client, operation:str, result_key:str, page_size:int=None, max_items:int=None, flatten=None, **kwargs):
+    # yield result items page by page, following NextToken/Marker until the listing ends,
+    # or until at least max_items have been yielded while more pages remain.
+    # flatten turns result items of a page into the items yielded. returns whether the listing has ended
+    pagination_config = dict() if page_size is None else dict(PageSize=page_size)
+    paginator = client.get_paginator(operation)
+    count = 0
+    for page in paginator.paginate(PaginationConfig=pagination_config, **kwargs):
+        items = page[result_key] if flatten is None else flatten(page[result_key])
+        yield items
+        count += len(items)
+        if max_items is not None and count >= max_items and (page.get("NextToken") or page.get("IsTruncated")):
+            return False
+    return True
+
+def _describe_availability_zones(client:boto3.client):
+    # describe_availability_zones is not paginated
+    response = client.describe_availability_zones(
+        Filters=[{"Name": "state", "Values": ["available"]}]
+    )
+    yield response["AvailabilityZones"]
+
+def _describe_instances(client:boto3.client, **kwargs):
+    def flatten(reservations:list) -> list:
+        return [
+            instance for reservation in reservations
+            for instance in reservation["Instances"]
+        ]
+    return (yield from _paginate(client, "describe_instances", "Reservations", 1000, flatten=flatten, **kwargs))
+
+def _describe_key_pairs(client:boto3.client):
+    # describe_key_pairs is not paginated
+    yield client.describe_key_pairs()["KeyPairs"]
+
+def _describe_security_groups(client:boto3.client, **kwargs):
+    yield from _paginate(client, "describe_security_groups", "SecurityGroups", 1000, **kwargs)
+
+def _describe_subnets(client:boto3.client, **kwargs):
+    yield from _paginate(client, "describe_subnets", "Subnets", 1000, **kwargs)
+
+def _describe_volumes(client:boto3.client, **kwargs):
+    return (yield from _paginate(client, "describe_volumes", "Volumes", 500, **kwargs))
+
+def _describe_vpcs(client:boto3.client):
+    yield from _paginate(client, "describe_vpcs", "Vpcs", 1000)
+
+def _list_hosted_zones(client:boto3.client):
+    yield from _paginate(client, "list_hosted_zones", "HostedZones", 100)
+
+def _describe_ssm_parameters(client:boto3.client, **kwargs):
+    return (yield from _paginate(client, "describe_parameters", "Parameters", 50, **kwargs))
+
+def submit_get_parameters_batches(client:boto3.client, names:list, executor:ThreadPoolExecutor) -> list:
+    """
+    submit get_parameters calls for given names in batches of SSM_GET_PARAMETERS_BATCH_SIZE
+    returns futures of the batches in order
+    """
+    return [
+        executor.submit(client.get_parameters, Names=names[i:i + SSM_GET_PARAMETERS_BATCH_SIZE])
+        for i in range(0, len(names), SSM_GET_PARAMETERS_BATCH_SIZE)
+    ]
+
+def _get_ssm_parameter_values(client:boto3.client, max_items:int=None):
+    # values of String and StringList parameters share the one cached listing of names.
+    # get_parameters accepts at most 10 names, so each page of names is resolved in concurrent
+    # batches while the next page is being listed
+    with ThreadPoolExecutor(max_workers=SSM_GET_PARAMETERS_MAX_WORKERS) as executor:
+        pending = None
+        for parameters in inventory.iter_pages("ssm_parameters", client, max_items=max_items):
+            names = [param["Name"] for param in parameters if param["Type"] in ("String", "StringList")]
+            futures = submit_get_parameters_batches(client, names, executor)
+            if pending is not None:
+                yield [param for future in pending for param in future.result()["Parameters"]]
+            pending = futures
+        if pending is not None:
+            yield [param for future in pending for param in future.result()["Parameters"]]
+    return inventory.is_complete("ssm_parameters", client)
+
+
+class AwsInventory:
+    """
+    per-session cache of aws resource listings shared by every parameter class
+    - entries are keyed by (account id, region, resource type) and expire after `ttl` seconds
+    - concurrent lookups of the same key wait for a single list call
+    - with a disk cache, listings left by previous sessions are served at once even if expired,
+      and `revalidate` lists them again (stale-while-revalidate)
+    - without `serve_stale`, expired listings of the disk cache are listed again instead, as headless runs do
+    - VPC_SCOPED_RESOURCES can be listed within a single vpc, cached apart as `<resource type>@<vpc id>`
+    - SEARCH_RESOURCES can be listed partially, such listings are cached as incomplete and shared
+      by every lookup satisfied with a part
+    """
+
+    fetchers = {
+        "availability_zones": _describe_availability_zones,
+        "instances": _describe_instances,
+        "key_pairs": _describe_key_pairs,
+        "security_groups": _describe_security_groups,
+        "subnets": _describe_subnets,
+        "volumes": _describe_volumes,
+        "vpcs": _describe_vpcs,
+        "hosted_zones": _list_hosted_zones,
+        "ssm_parameters": _describe_ssm_parameters,
+        "ssm_parameter_values": _get_ssm_parameter_values,
+    }
+    services = {
+        "availability_zones": "ec2",
+        "instances": "ec2",
+        "key_pairs": "ec2",
+        "security_groups": "ec2",
+        "subnets": "ec2",
+        "volumes": "ec2",
+        "vpcs": "ec2",
+        "hosted_zones": "route53",
+        "ssm_parameters": "ssm",
+        "ssm_parameter_values": "ssm",
+    }
 
-    return get_vpc_name, get_subnet_name, get_instance_name, get_volume_name
+    def __init__(self, ttl:float=300, disk_cache:DiskInventoryCache=None, serve_stale:bool=True) -> None:
+        self.ttl = ttl
+        self.disk_cache = disk_cache
+        self.serve_stale = serve_stale
+        self._entries = dict()
+        self._key_locks = dict()
+        self._lock = threading.Lock()
+        self._account_lock = threading.Lock()
+        # account ids keyed by profile, and the profile to list each account with again
+        self._account_ids = dict()
+        self._account_profiles = dict()
+
+    def get_account_id(self, profile:str=None) -> str:
+        with self._account_lock:
+            return self._get_account_id(profile)
+
+    def _get_account_id(self, profile:str=None) -> str:
+        if profile not in self._account_ids:
+            try:
+                account_id = client_pool.get_client("sts", profile=profile).get_caller_identity()["Account"]
+            except Exception as ex:
+                logger.warning("failed to get account id of profile %s, fall back to 'default' : %s", profile, ex)
+                account_id = "default" if profile is None else f"default-{profile}"
+            self._account_ids[profile] = account_id
+            self._account_profiles.setdefault(account_id, profile)
+        return self._account_ids[profile]
+
+    def _key(self, resource_type:str, client:boto3.client, vpc_id:str=None) -> tuple:
+        if vpc_id is not None:
+            resource_type = f"{resource_type}@{vpc_id}"
+        return (self.get_account_id(client_pool.profile_of(client)), client.meta.region_name, resource_type)
+
+    def _vpc_entry(self, resource_type:str, client:boto3.client, vpc_id:str) -> InventoryEntry:
+        # a usable listing of the whole region serves listings of its vpcs without any call
+        with self._key_lock(self._key(resource_type, client)):
+            entry = self._usable_entry(self._key(resource_type, client))
+        if entry is None or not entry.complete:
+            return None
+        return InventoryEntry([item for item in entry.items if item.get("VpcId") == vpc_id], entry.fetched_at, entry.stale)
+
+    def _key_lock(self, key:tuple) -> threading.RLock:
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.RLock())
+
+    def _usable_entry(self, key:tuple) -> InventoryEntry:
+        entry = self._entries.get(key)
+        if entry is not None and (entry.stale or time() - entry.fetched_at < self.ttl):
+            return entry
+        if entry is not None or self.disk_cache is None:
+            return None
+        entry = self.disk_cache.load(key)
+        if entry is None:
+            return None
+        entry.stale = time() - entry.fetched_at >= self.ttl
+        logger.debug("inventory loaded from disk : %s (stale: %s)", key, entry.stale)
+        if entry.stale and not self.serve_stale:
+            return None
+        self._entries[key] = entry
+        return entry
+
+    def iter_pages(self, resource_type:str, client:boto3.client, refresh:bool=False, vpc_id:str=None, max_items:int=None):
+        """
+        yield resource listings page by page as they arrive from aws
+        - a usable cached listing is yielded as a single page unless `refresh` is set
+        - with vpc_id, only resources in the vpc are listed, filtered on vpc-id
+        - with max_items, SEARCH_RESOURCES stop being listed after at least that many items if more pages remain,
+          and an incomplete cached listing is usable. without it, an incomplete listing is made again as a whole
+        - `refresh` makes an incomplete listing again only as far as it was made
+        """
+        if vpc_id is not None and not refresh:
+            entry = self._vpc_entry(resource_type, client, vpc_id)
+            if entry is not None:
+                logger.debug("inventory hit : %s in %s", resource_type, vpc_id)
+                yield entry.items
+                return
+        key = self._key(resource_type, client, vpc_id)
+        waited = monotonic()
+        with self._key_lock(key), tracer.span(f"inventory {resource_type}", "inventory", region=key[1], vpc=vpc_id) as span:
+            # time spent waiting for the same listing made by another thread
+            span["wait"] = round(monotonic() - waited, 6)
+            in_memory = key in self._entries
+            entry = None if refresh else self._usable_entry(key)
+            if entry is not None and (entry.complete or max_items is not None):
+                logger.debug("inventory hit : %s", key)
+                span.update(
+                    cache="memory" if in_memory else "disk", stale=entry.stale, complete=entry.complete,
+                    pages=1, items=len(entry.items),
+                )
+                yield entry.items
+                return
+            if refresh and max_items is None and key in self._entries and not self._entries[key].complete:
+                max_items = len(self._entries[key].items)
+            logger.debug("inventory miss : %s", key)
+            span.update(cache="refresh" if refresh else "miss", pages=0, items=0)
+            items = []
+            kwargs = {} if vpc_id is None else dict(Filters=[dict(Name="vpc-id", Values=[vpc_id])])
+            if max_items is not None and resource_type in SEARCH_RESOURCES:
+                kwargs["max_items"] = max_items
+            pages = self.fetchers[resource_type](client, **kwargs)
+            while True:
+                try:
+                    page = next(pages)
+                except StopIteration as stop:
+                    # fetchers cut short by max_items return False
+                    complete = stop.value is not False
+                    break
+                items.extend(page)
+                span["pages"] += 1
+                span["items"] += len(page)
+                yield page
+            span["complete"] = complete
+            entry = InventoryEntry(items, time(), complete=complete)
+            self._entries[key] = entry
+            if self.disk_cache is not None:
+                self.disk_cache.save(key, entry)
+
+    def get_entry(self, resource_type:str, client:boto3.client, refresh:bool=False, vpc_id:str=None) -> InventoryEntry:
+        if vpc_id is not None and not refresh:
+            entry = self._vpc_entry(resource_type, client, vpc_id)
+            if entry is not None:
+                return entry
+        key = self._key(resource_type, client, vpc_id)
+        with self._key_lock(key):
+            entry = None if refresh else self._usable_entry(key)
+            if entry is None or not entry.complete:
+                for _ in self.iter_pages(resource_type, client, refresh=refresh, vpc_id=vpc_id):
+                    pass
+                entry = self._entries[key]
+            return entry
+
+    def _cached_entry(self, resource_type:str, client:boto3.client, vpc_id:str=None) -> InventoryEntry:
+        # the listing of the vpc if it has been made, else the whole listing it is filtered from
+        entry = self._entries.get(self._key(resource_type, client, vpc_id))
+        if entry is None and vpc_id is not None:
+            entry = self._entries.get(self._key(resource_type, client))
+        return entry
+
+    def fetched_at(self, resource_type:str, client:boto3.client, vpc_id:str=None) -> float:
+        # when the cached listing was made, None if it is not cached
+        entry = self._cached_entry(resource_type, client, vpc_id)
+        return None if entry is None else entry.fetched_at
+
+    def is_complete(self, resource_type:str, client:boto3.client, vpc_id:str=None) -> bool:
+        # whether the cached listing has been made to its end
+        entry = self._cached_entry(resource_type, client, vpc_id)
+        return entry is not None and entry.complete
+
+    def is_stale(self, resource_type:str, client:boto3.client, vpc_id:str=None) -> bool:
+        # whether the cached listing has expired, or has been served stale from the disk cache
+        entry = self._cached_entry(resource_type, client, vpc_id)
+        return entry is not None and (entry.stale or time() - entry.fetched_at >= self.ttl)
+
+    def invalidate(self, resource_type:str=None, region:str=None, account_id:str=None) -> int:
+        """
+        drop cached entries matching all of given conditions (None matches everything)
+        returns the number of dropped entries
+        """
+        def matches(key:tuple) -> bool:
+            return (account_id is None or key[0] == account_id) \
+                and (region is None or key[1] == region) \
+                and (resource_type is None or key[2].split("@")[0] == resource_type)
+
+        with self._lock:
+            keys = [key for key in self._entries if matches(key)]
+            for key in keys:
+                del self._entries[key]
+        logger.debug("inventory invalidated : %s", keys)
+        if self.disk_cache is not None:
+            self.disk_cache.remove(matches)
+        return len(keys)
+
+    def stale_keys(self) -> list:
+        with self._lock:
+            return [key for key, entry in self._entries.items() if entry.stale]
+
+    def revalidate(self, max_workers:int=PREFETCH_MAX_WORKERS) -> set:
+        """
+        list again every listing served stale from the disk cache
+        returns the resource types which have been revalidated
+        """
+        keys = self.stale_keys()
+        if len(keys) == 0:
+            return set()
+        def fetch(key:tuple):
+            account_id, region, scoped_type = key
+            resource_type, _, vpc_id = scoped_type.partition("@")
+            try:
+                # listings of accounts never looked up in this session are left to the default profile
+                profile = self._account_profiles.get(account_id)
+                client = client_pool.get_client(self.services[resource_type], region, profile)
+                self.get_entry(resource_type, client, refresh=True, vpc_id=vpc_id or None)
+                return resource_type
+            except Exception as ex:
+                logger.warning("failed to revalidate %s : %s", key, ex)
+                return None
+
+        logger.debug("revalidate inventories : %s", keys)
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(keys))) as executor:
+            return set(resource_type for resource_type in executor.map(fetch, keys) if resource_type is not None)
+
+    def prefetch(self, resource_types:set, max_workers:int=PREFETCH_MAX_WORKERS, executor:ThreadPoolExecutor=None,
+                 regions:list=None, profile:str=None) -> list:
+        """
+        list all of given resource types concurrently so that following lookups hit the cache
+        - with regions, every resource type is listed in each of them at once (None is the default region)
+        - failures are only logged here and surface again when the listing is actually used
+        - if executor is given, listings are only submitted to it and their futures are returned
+        """
+        targets = [(resource_type, region) for region in (regions or [None]) for resource_type in sorted(resource_types)]
+        if len(targets) == 0:
+            return []
+        def fetch(target:tuple):
+            resource_type, region = target
+            try:
+                self.get_entry(resource_type, client_pool.get_client(self.services[resource_type], region, profile))
+            except Exception as ex:
+                logger.warning("failed to prefetch %s in %s : %s", resource_type, region, ex)
+
+        logger.debug("prefetch inventories : %s", targets)
+        if executor is not None:
+            return [executor.submit(fetch, target) for target in targets]
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(targets))) as executor:
+            list(executor.map(fetch, targets))
+        return []
+
+inventory = AwsInventory(
+    ttl=INVENTORY_TTL, disk_cache=DiskInventoryCache(CACHE_BASE_DIR, CACHE_MAX_BYTES),
+)
+
+_executor = None
+def get_executor() -> ThreadPoolExecutor:
+    # shared worker threads for aws calls made in the background of the kernel
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=PREFETCH_MAX_WORKERS, thread_name_prefix="aws-cfn-nb-extensions",
+        )
+    return _executor
+
+
+# inventory resource types listed by each aws-specific parameter type
+PARAMETER_TYPE_RESOURCES = {
+    "AWS::EC2::AvailabilityZone::Name": ["availability_zones"],
+    "AWS::SSM::Parameter::Name": ["ssm_parameters"],
+    "AWS::SSM::Parameter::Value<String>": ["ssm_parameter_values"],
+    "AWS::SSM::Parameter::Value<List<String>>": ["ssm_parameter_values"],
+    "AWS::SSM::Parameter::Value<CommaDelimitedList>": ["ssm_parameter_values"],
+    "AWS::EC2::Instance::Id": ["instances"],
+    "AWS::EC2::KeyPair::KeyName": ["key_pairs"],
+    # security group and subnet options are labeled with their vpc's name, looked up by name_tags
+    "AWS::EC2::SecurityGroup::GroupName": ["security_groups"],
+    "AWS::EC2::SecurityGroup::Id": ["security_groups"],
+    "AWS::EC2::Subnet::Id": ["subnets"],
+    "AWS::EC2::Volume::Id": ["volumes"],
+    "AWS::EC2::VPC::Id": ["vpcs"],
+    "AWS::Route53::HostedZone::Id": ["hosted_zones"],
+}
+
+def get_parameter_type_resources(parameter_type:str) -> set:
+    try:
+        return set(PARAMETER_TYPE_RESOURCES[parameter_type])
+    except KeyError:
+        pass
+    if parameter_type.startswith("List<"):
+        return get_parameter_type_resources(parameter_type[len("List<"):-1])
+    if parameter_type.startswith("AWS::SSM::Parameter::Value<"):
+        aws_type = parameter_type[len("AWS::SSM::Parameter::Value<"):-1]
+        return {"ssm_parameter_values"} | get_parameter_type_resources(aws_type)
+    return set()
+
+def plan_inventory_prefetch(parameter_defs:dict, vpc_dependencies:dict=None) -> set:
+    """
+    collect distinct inventory resource types needed to build widgets for all parameters
+    - SEARCH_RESOURCES are left to widgets, which list them only partially
+    - parameters in vpc_dependencies are left out, they are listed within their vpc once it is chosen
+    """
+    resource_types = set()
+    for param_name, param_def in parameter_defs.items():
+        if param_name not in (vpc_dependencies or {}):
+            resource_types |= get_parameter_type_resources(param_def["Type"])
+    return resource_types - set(SEARCH_RESOURCES)
+
+def find_vpc_dependencies(parameter_defs:dict, rules:dict=None) -> dict:
+    """
+    find subnet and security group parameters scoped by a AWS::EC2::VPC::Id parameter
+    - rules asserting `Fn::ValueOf: [param, VpcId]` or `Fn::ValueOfAll: [type, VpcId]` to equal
+      `Ref: vpc param` with Fn::Equals or Fn::EachMemberEquals scope those parameters by that vpc parameter
+    - the others are left unscoped, even if the template has only one vpc parameter, since nothing requires
+      them to be in that vpc
+    returns {parameter name: vpc parameter name}
+    """
+    vpc_params = [name for name, param_def in parameter_defs.items() if param_def["Type"] == "AWS::EC2::VPC::Id"]
+    scoped = [
+        name for name, param_def in parameter_defs.items()
+        if allowed_values_resolver.vpc_scoped(param_def["Type"])
+    ]
+
+    def vpc_ref(node) -> str:
+        if isinstance(node, dict) and list(node) == ["Ref"] and node["Ref"] in vpc_params:
+            return node["Ref"]
+        return None
+
+    def vpc_id_of(node) -> list:
+        # parameters whose VpcId attribute the node refers to
+        if not isinstance(node, dict) or len(node) != 1:
+            return []
+        (function, args), = node.items()
+        if not isinstance(args, list) or len(args) != 2 or args[1] != "VpcId":
+            return []
+        if function == "Fn::ValueOf" and args[0] in scoped:
+            return [args[0]]
+        if function == "Fn::ValueOfAll":
+            return [name for name in scoped if parameter_defs[name]["Type"] in (args[0], f"List<{args[0]}>")]
+        return []
+
+    dependencies = dict()
+    def walk(node):
+        if isinstance(node, dict):
+            for function in ("Fn::Equals", "Fn::EachMemberEquals"):
+                args = node.get(function)
+                if isinstance(args, list) and len(args) == 2:
+                    for left, right in (args, args[::-1]):
+                        vpc_param = vpc_ref(right)
+                        if vpc_param is not None:
+                            for name in vpc_id_of(left):
+                                dependencies.setdefault(name, vpc_param)
+            for value in node.values():
+                walk(value)
+        elif isinstance(node, list):
+            for value in node:
+                walk(value)
+    walk(rules or {})
+    return dependencies
+
+
+def get_name_tag(tags:list, default:str="") -> str:
+    name = [tag["Value"] for tag in tags if tag["Key"] == "Name"]
+    try:
+        return name[0]
+    except IndexError:
+        return default
+
+class NameTagResolver:
+    """
+    Name tags of ec2 resources looked up by their ids
+    - ids missing from the cache are resolved together by describe_tags filtered on resource-id and key=Name
+    - resources without Name tag are cached as such, so they are never looked up twice
+    - names are cached per (account id, region) for `ttl` seconds
+    """
+
+    def __init__(self, ttl:float=300, batch_size:int=DESCRIBE_TAGS_BATCH_SIZE) -> None:
+        self.ttl = ttl
+        self.batch_size = batch_size
+        # {(account id, region): {resource id: (name or None, fetched_at)}}
+        self._names = dict()
+        self._scope_locks = dict()
+        self._lock = threading.Lock()
+
+    def _scope(self, client:boto3.client) -> tuple:
+        return (inventory.get_account_id(client_pool.profile_of(client)), client.meta.region_name)
+
+    def _scope_lock(self, scope:tuple) -> threading.Lock:
+        with self._lock:
+            return self._scope_locks.setdefault(scope, threading.Lock())
+
+    def remember(self, resources:list, id_key:str, client:boto3.client):
+        # names of resources listed with their tags are known without any lookup
+        scope = self._scope(client)
+        fetched_at = time()
+        with self._scope_lock(scope):
+            names = self._names.setdefault(scope, dict())
+            for resource in resources:
+                names[resource[id_key]] = (get_name_tag(resource.get("Tags", []), None), fetched_at)
+
+    def resolve(self, resource_ids:set, client:boto3.client) -> dict:
+        """
+        returns {resource id: name}, None for resources without Name tag
+        """
+        scope = self._scope(client)
+        with self._scope_lock(scope):
+            names = self._names.setdefault(scope, dict())
+            now = time()
+            missing = sorted(
+                resource_id for resource_id in set(resource_ids)
+                if resource_id not in names or now - names[resource_id][1] >= self.ttl
+            )
+            if len(missing) > 0:
+                with tracer.span("name tags", "inventory", region=scope[1], ids=len(missing)):
+                    found = dict()
+                    for i in range(0, len(missing), self.batch_size):
+                        filters = [
+                            {"Name": "resource-id", "Values": missing[i:i + self.batch_size]},
+                            {"Name": "key", "Values": ["Name"]},
+                        ]
+                        for tags in _paginate(client, "describe_tags", "Tags", Filters=filters):
+                            found.update((tag["ResourceId"], tag["Value"]) for tag in tags)
+                logger.debug("resolved name tags : %s of %s", len(found), len(missing))
+                fetched_at = time()
+                for resource_id in missing:
+                    names[resource_id] = (found.get(resource_id), fetched_at)
+            return {resource_id: names[resource_id][0] for resource_id in resource_ids}
+
+    def clear(self):
+        with self._lock:
+            self._names.clear()
+
+name_tags = NameTagResolver(ttl=INVENTORY_TTL)
+
+
+class AllowedValuesResolver:
+    """
+    headless registry of allowed (id, label) pairs for aws-specific parameter types
+    - builds on the inventory only, no widget is created
+    - List<> types resolve to the values of their element type
+    - AWS::SSM::Parameter::Value<...> types resolve to ssm parameters whose values are allowed for the inner type
+    - resolved pairs are memoized until any inventory listing they are made of is listed again
+    - types registered with vpc_scoped=True can be resolved within a single vpc
+    - types which cannot be listed, such as amis, register a pattern their values are checked with instead
+    """
+
+    ssm_value_prefix = "AWS::SSM::Parameter::Value<"
+
+    def __init__(self, inventory:AwsInventory) -> None:
+        self.inventory = inventory
+        self._resolvers = dict()
+        self._searches = dict()
+        self._patterns = dict()
+        self._vpc_scoped = set()
+        self._memo = dict()
+        self._lock = threading.Lock()
+
+    def register(self, parameter_type:str, service:str, vpc_scoped:bool=False):
+        def decorator(func):
+            self._resolvers[parameter_type] = (service, func)
+            if vpc_scoped:
+                self._vpc_scoped.add(parameter_type)
+            return func
+        return decorator
+
+    def register_search(self, parameter_type:str, service:str):
+        def decorator(func):
+            self._searches[parameter_type] = (service, func)
+            return func
+        return decorator
+
+    def register_pattern(self, parameter_type:str, pattern:str):
+        self._patterns[parameter_type] = pattern
+
+    def _normalize(self, parameter_type:str) -> str:
+        if parameter_type.startswith("List<") and parameter_type[len("List<"):-1] in self._resolvers:
+            return parameter_type[len("List<"):-1]
+        return parameter_type
+
+    def _resolver(self, parameter_type:str) -> tuple:
+        try:
+            return self._resolvers[parameter_type]
+        except KeyError:
+            pass
+        if parameter_type.startswith(self.ssm_value_prefix):
+            aws_type = parameter_type[len(self.ssm_value_prefix):-1]
+            def resolve_ssm_specific(client:boto3.client):
+                return self._iter_ssm_specific_pages(aws_type, client)
+            return ("ssm", resolve_ssm_specific)
+        return None
+
+    def resolvable(self, parameter_type:str) -> bool:
+        return self._resolver(self._normalize(parameter_type)) is not None
+
+    def searchable(self, parameter_type:str) -> bool:
+        return self._normalize(parameter_type) in self._searches
+
+    def vpc_scoped(self, parameter_type:str) -> bool:
+        return self._normalize(parameter_type) in self._vpc_scoped
+
+    def complete(self, parameter_type:str, region:str=None, profile:str=None, vpc_id:str=None) -> bool:
+        # whether every inventory listing the pairs are made of has been made to its end
+        return all(
+            self.inventory.is_complete(
+                resource_type, client_pool.get_client(self.inventory.services[resource_type], region, profile),
+                vpc_id if resource_type in VPC_SCOPED_RESOURCES else None,
+            )
+            for resource_type in get_parameter_type_resources(parameter_type)
+        )
 
-get_vpc_name, get_subnet_name, get_instance_name, get_volume_name = name_tag_getter()
+    def _token(self, parameter_type:str, region:str, profile:str=None, vpc_id:str=None) -> tuple:
+        # identifies the inventory listings the resolved pairs are made of
+        token = []
+        for resource_type in sorted(get_parameter_type_resources(parameter_type)):
+            client = client_pool.get_client(self.inventory.services[resource_type], region, profile)
+            scope = vpc_id if resource_type in VPC_SCOPED_RESOURCES else None
+            token.append((resource_type, self.inventory.fetched_at(resource_type, client, scope)))
+        return tuple(token)
 
-def instance_name_getter():
-    vpcs = dict()
-    def get_vpc_name(vpc_id:str, client:boto3.client) -> str:
+    def iter_pages(self, parameter_type:str, region:str=None, profile:str=None, vpc_id:str=None, max_items:int=None):
+        """
+        yield allowed (id, label) pairs page by page as the underlying listings arrive
+        - vpc_id is ignored by types which are not vpc scoped
+        - with max_items, types which can be searched on aws are resolved from listings cut short after
+          that many items, see `complete`. the others ignore it
+        """
+        parameter_type = self._normalize(parameter_type)
+        resolver = self._resolver(parameter_type)
+        if resolver is None:
+            return
+        if parameter_type not in self._vpc_scoped:
+            vpc_id = None
+        if parameter_type not in self._searches:
+            max_items = None
+        memo_key = (parameter_type, region, profile, vpc_id, max_items)
+        with self._lock:
+            memo = self._memo.get(memo_key)
+        if memo is not None and memo[0] == self._token(parameter_type, region, profile, vpc_id):
+            yield memo[1]
+            return
+
+        service, func = resolver
+        client = client_pool.get_client(service, region, profile)
+        pairs = []
+        kwargs = dict()
+        if vpc_id is not None:
+            kwargs["vpc_id"] = vpc_id
+        if max_items is not None:
+            kwargs["max_items"] = max_items
+        for page in func(client, **kwargs):
+            pairs.extend(page)
+            yield page
+        with self._lock:
+            self._memo[memo_key] = (self._token(parameter_type, region, profile, vpc_id), pairs)
+
+    def resolve(self, parameter_type:str, region:str=None, profile:str=None, vpc_id:str=None) -> list:
+        return [pair for page in self.iter_pages(parameter_type, region, profile, vpc_id) for pair in page]
+
+    def search(self, parameter_type:str, query:str, limit:int=SEARCH_MAX_OPTIONS, region:str=None, profile:str=None) -> list:
+        """
+        return at most `limit` allowed (id, label) pairs matching the query
+        - the query is pushed down to aws as filters, results are neither cached nor memoized
+        """
+        service, func = self._searches[self._normalize(parameter_type)]
+        pairs = []
+        pages = func(client_pool.get_client(service, region, profile), query)
         try:
-            return vpcs[vpc_id]
-        except KeyError:
-            resp = client.describe_vpcs()
-            for vpc in resp["Vpcs"]:
-                try:
-                    tags = vpc["Tags"]
-                except KeyError:
-                    vpcs[vpc["VpcId"]] = vpc["VpcId"]
-                    continue
-                name = [tag["Value"] for tag in tags if tag["Key"] == "Name"]
-                try:
-                    vpcs[vpc["VpcId"]] = name[0]
-                except IndexError:
-                    vpcs[vpc["VpcId"]] = vpc["VpcId"]
+            for page in pages:
+                pairs.extend(page)
+                if len(pairs) >= limit:
+                    break
+        finally:
+            pages.close()
+        return pairs[:limit]
+
+    def _value_check(self, parameter_type:str, region:str=None, profile:str=None):
+        # whether a single value is allowed for the type, by its pattern or else by its listing
+        pattern = self._patterns.get(parameter_type)
+        if pattern is not None:
+            return lambda value: compile_pattern(pattern).match(value) is not None
+        if self._resolver(parameter_type) is None:
+            raise ValueError(f"values of {parameter_type} can be neither listed nor checked with a pattern")
+        allowed = set(value for value, _ in self.resolve(parameter_type, region, profile))
+        return lambda value: value in allowed
+
+    def ssm_value_rule(self, aws_type:str, region:str=None, profile:str=None) -> tuple:
+        """
+        how ssm parameters are checked for AWS::SSM::Parameter::Value<aws_type>
+        returns the ssm parameter type they must be of, and whether their value is allowed
+        """
+        if aws_type == "String":
+            return ("String", lambda value: True)
+        if aws_type in ("List<String>", "CommaDelimitedList"):
+            return ("StringList", lambda value: True)
+        if aws_type.startswith("List<"):
+            check = self._value_check(aws_type[len("List<"):-1], region, profile)
+            return ("StringList", lambda value: all(check(v) for v in value.split(",")))
+        return ("String", self._value_check(aws_type, region, profile))
+
+    def check_ssm_parameters(self, parameter_type:str, names:list, region:str=None, profile:str=None) -> dict:
+        """
+        look up ssm parameters given to an AWS::SSM::Parameter::Value<...> type by their names
+        - get_parameters finds public parameters too, which are never listed in the account
+        returns {name: why it is not allowed} of names which are not
+        """
+        ssm_type, accept = self.ssm_value_rule(parameter_type[len(self.ssm_value_prefix):-1], region, profile)
+        client = client_pool.get_client("ssm", region, profile)
+        found = dict()
+        with ThreadPoolExecutor(max_workers=SSM_GET_PARAMETERS_MAX_WORKERS) as executor:
+            for future in submit_get_parameters_batches(client, sorted(set(names)), executor):
+                found.update((param["Name"], param) for param in future.result()["Parameters"])
+        problems = dict()
+        for name in names:
+            param = found.get(name)
+            if param is None:
+                problems[name] = "is not found in aws"
+            elif param["Type"] != ssm_type:
+                problems[name] = f"is not a {ssm_type} parameter"
+            elif not accept(param["Value"]):
+                problems[name] = f"holds {param['Value']}, which is not allowed"
+        return problems
+
+    def _iter_ssm_specific_pages(self, aws_type:str, client:boto3.client):
+        ssm_type, accept = self.ssm_value_rule(aws_type, client.meta.region_name, client_pool.profile_of(client))
+        for parameters in self.inventory.iter_pages("ssm_parameter_values", client):
+            yield [
+                (param["Name"], f"{param['Name']} | {param['Value']}") for param in parameters
+                if param["Type"] == ssm_type and accept(param["Value"])
+            ]
+
+allowed_values_resolver = AllowedValuesResolver(inventory)
+
+
+@allowed_values_resolver.register("AWS::EC2::AvailabilityZone::Name", "ec2")
+def _resolve_availability_zones(client:boto3.client):
+    for azs in inventory.iter_pages("availability_zones", client):
+        yield [(az["ZoneName"], az["ZoneName"]) for az in azs]
+
+@allowed_values_resolver.register("AWS::SSM::Parameter::Name", "ssm")
+def _resolve_ssm_parameter_names(client:boto3.client, max_items:int=None):
+    for parameters in inventory.iter_pages("ssm_parameters", client, max_items=max_items):
+        yield [(param["Name"], param["Name"]) for param in parameters]
+
+def ssm_parameter_values_resolver(ssm_type:str):
+    def resolve_ssm_parameter_values(client:boto3.client, max_items:int=None):
+        for parameters in inventory.iter_pages("ssm_parameter_values", client, max_items=max_items):
+            yield [
+                (param["Name"], f"{param['Name']} | {param['Value']}") for param in parameters
+                if param["Type"] == ssm_type
+            ]
+    return resolve_ssm_parameter_values
+
+def ssm_parameter_values_searcher(ssm_type:str):
+    def search_ssm_parameter_values(client:boto3.client, query:str):
+        parameter_filters = [
+            {"Key": "Name", "Option": "BeginsWith", "Values": [query]},
+            {"Key": "Type", "Option": "Equals", "Values": [ssm_type]},
+        ]
+        with ThreadPoolExecutor(max_workers=SSM_GET_PARAMETERS_MAX_WORKERS) as executor:
+            for parameters in _describe_ssm_parameters(client, ParameterFilters=parameter_filters):
+                futures = submit_get_parameters_batches(client, [param["Name"] for param in parameters], executor)
+                yield [
+                    (param["Name"], f"{param['Name']} | {param['Value']}")
+                    for future in futures for param in future.result()["Parameters"]
+                ]
+    return search_ssm_parameter_values
+
+allowed_values_resolver.register("AWS::SSM::Parameter::Value<String>", "ssm")(
+    ssm_parameter_values_resolver("String"))
+allowed_values_resolver.register("AWS::SSM::Parameter::Value<List<String>>", "ssm")(
+    ssm_parameter_values_resolver("StringList"))
+allowed_values_resolver.register("AWS::SSM::Parameter::Value<CommaDelimitedList>", "ssm")(
+    ssm_parameter_values_resolver("StringList"))
+allowed_values_resolver.register_search("AWS::SSM::Parameter::Value<String>", "ssm")(
+    ssm_parameter_values_searcher("String"))
+allowed_values_resolver.register_search("AWS::SSM::Parameter::Value<List<String>>", "ssm")(
+    ssm_parameter_values_searcher("StringList"))
+allowed_values_resolver.register_search("AWS::SSM::Parameter::Value<CommaDelimitedList>", "ssm")(
+    ssm_parameter_values_searcher("StringList"))
+
+@allowed_values_resolver.register_search("AWS::SSM::Parameter::Name", "ssm")
+def _search_ssm_parameter_names(client:boto3.client, query:str):
+    parameter_filters = [{"Key": "Name", "Option": "BeginsWith", "Values": [query]}]
+    for parameters in _describe_ssm_parameters(client, ParameterFilters=parameter_filters):
+        yield [(param["Name"], param["Name"]) for param in parameters]
+
+def ec2_search_filters(query:str, id_prefix:str, id_filter:str, vpc_filter:str=None) -> list:
+    # ids are matched by prefix, vpc ids by the vpc resources are in, and anything else by the Name tag
+    if query.startswith(id_prefix):
+        return [{"Name": id_filter, "Values": [f"{query}*"]}]
+    if vpc_filter is not None and query.startswith("vpc-"):
+        return [{"Name": vpc_filter, "Values": [f"{query}*"]}]
+    return [{"Name": "tag:Name", "Values": [f"*{query}*"]}]
+
+def _instance_pair(instance:dict) -> tuple:
+    return (instance["InstanceId"], f"{instance['InstanceId']} | {get_name_tag(instance.get('Tags', []), instance['InstanceId'])}")
+
+def _volume_pair(volume:dict) -> tuple:
+    return (volume["VolumeId"], f"{volume['VolumeId']} | {get_name_tag(volume.get('Tags', []), volume['VolumeId'])}")
+
+@allowed_values_resolver.register("AWS::EC2::Instance::Id", "ec2")
+def _resolve_instance_ids(client:boto3.client, max_items:int=None):
+    for instances in inventory.iter_pages("instances", client, max_items=max_items):
+        yield [_instance_pair(instance) for instance in instances]
+
+@allowed_values_resolver.register_search("AWS::EC2::Instance::Id", "ec2")
+def _search_instance_ids(client:boto3.client, query:str):
+    for instances in _describe_instances(client, Filters=ec2_search_filters(query, "i-", "instance-id", "vpc-id")):
+        yield [_instance_pair(instance) for instance in instances]
+
+@allowed_values_resolver.register("AWS::EC2::KeyPair::KeyName", "ec2")
+def _resolve_key_names(client:boto3.client):
+    for keys in inventory.iter_pages("key_pairs", client):
+        yield [(key["KeyName"], key["KeyName"]) for key in keys]
+
+@allowed_values_resolver.register("AWS::EC2::SecurityGroup::GroupName", "ec2", vpc_scoped=True)
+def _resolve_security_group_names(client:boto3.client, vpc_id:str=None):
+    for security_groups in inventory.iter_pages("security_groups", client, vpc_id=vpc_id):
+        vpc_names = name_tags.resolve(set(sg["VpcId"] for sg in security_groups), client)
+        yield [
+            (sg["GroupName"], f"{sg['GroupName']} | {vpc_names[sg['VpcId']] or sg['VpcId']}")
+            for sg in security_groups
+        ]
+
+@allowed_values_resolver.register("AWS::EC2::SecurityGroup::Id", "ec2", vpc_scoped=True)
+def _resolve_security_group_ids(client:boto3.client, vpc_id:str=None):
+    for security_groups in inventory.iter_pages("security_groups", client, vpc_id=vpc_id):
+        vpc_names = name_tags.resolve(set(sg["VpcId"] for sg in security_groups), client)
+        yield [
+            (sg["GroupId"], f"{sg['GroupId']}({sg['GroupName']}) | {vpc_names[sg['VpcId']] or sg['VpcId']}")
+            for sg in security_groups
+        ]
+
+@allowed_values_resolver.register("AWS::EC2::Volume::Id", "ec2")
+def _resolve_volume_ids(client:boto3.client, max_items:int=None):
+    for volumes in inventory.iter_pages("volumes", client, max_items=max_items):
+        yield [_volume_pair(volume) for volume in volumes]
+
+@allowed_values_resolver.register_search("AWS::EC2::Volume::Id", "ec2")
+def _search_volume_ids(client:boto3.client, query:str):
+    for volumes in _describe_volumes(client, Filters=ec2_search_filters(query, "vol-", "volume-id")):
+        yield [_volume_pair(volume) for volume in volumes]
+
+@allowed_values_resolver.register("AWS::EC2::Subnet::Id", "ec2", vpc_scoped=True)
+def _resolve_subnet_ids(client:boto3.client, vpc_id:str=None):
+    for subnets in inventory.iter_pages("subnets", client, vpc_id=vpc_id):
+        vpc_names = name_tags.resolve(set(subnet["VpcId"] for subnet in subnets), client)
+        yield [
+            (subnet["SubnetId"], f"{subnet['SubnetId']}({get_name_tag(subnet.get('Tags', []), subnet['SubnetId'])}) | {vpc_names[subnet['VpcId']] or subnet['VpcId']}")
+            for subnet in subnets
+        ]
+
+@allowed_values_resolver.register("AWS::EC2::VPC::Id", "ec2")
+def _resolve_vpc_ids(client:boto3.client):
+    for vpcs in inventory.iter_pages("vpcs", client):
+        name_tags.remember(vpcs, "VpcId", client)
+        yield [
+            (vpc["VpcId"], f"{vpc['VpcId']} | {get_name_tag(vpc.get('Tags', []), vpc['VpcId'])}")
+            for vpc in vpcs
+        ]
+
+@allowed_values_resolver.register("AWS::Route53::HostedZone::Id", "route53")
+def _resolve_hosted_zone_ids(client:boto3.client):
+    for zones in inventory.iter_pages("hosted_zones", client):
+        yield [
+            (zone["Id"].split("/")[-1], f"{zone['Id'].split('/')[-1]} | {zone['Name']}")
+            for zone in zones
+        ]
+
 
-            return vpcs[vpc_id]
-    return get_vpc_name
-get_vpc_name = vpc_name_getter()
+@lru_cache(maxsize=None)
+def compile_pattern(pattern:str) -> re.Pattern:
+    return re.compile(pattern)
+
+def is_blank(value) -> bool:
+    return value is None or (isinstance(value, (str, tuple, list)) and len(value) == 0)
+
+def match_options(options:list, query:str, limit:int) -> list:
+    """
+    top `limit` (label, value) options whose label contains the query case-insensitively,
+    those starting with it first
+    """
+    if not query:
+        return options[:limit]
+    query = query.lower()
+    prefixed = []
+    contained = []
+    for option in options:
+        lowered = option[0].lower()
+        if lowered.startswith(query):
+            prefixed.append(option)
+            if len(prefixed) >= limit:
+                break
+        elif query in lowered:
+            contained.append(option)
+    return (prefixed + contained)[:limit]
+
+def format_errors(errors:list) -> str:
+    return "<br>".join(f"<font color='red'>{html.escape(error)}</font>" for error in errors)
 
 
 class BaseAwsParameter(ABC):
+    # whether allowed values are listed from aws after the widget has been created
+    aws_options = False
 
-    def __init__(self, param_name:str, param_def:dict) -> None:
+    def __init__(self, param_name:str, param_def:dict, headless:bool=False) -> None:
         self.name = param_name
         self.param_def = param_def
 
         self.type = param_def["Type"]
         self.description = param_def.get("Description", "")
         self.default_value = param_def.get("Default", None)
-        self.allowed_values = param_def.get("AllowedValues", [])
+        # value given by a parameter file or a stack, selected instead of the default
+        self.prefilled = None
+        self.allowed_values = list(param_def.get("AllowedValues", []))
+        # labels shown for allowed values listed from aws, keyed by their ids
+        self.allowed_labels = dict()
         self.allowed_pattern = param_def.get("AllowedPattern", ".*")
+        try:
+            self.pattern = compile_pattern(self.allowed_pattern)
+        except re.error as ex:
+            # cfn takes java regex such as \p{Alnum}, which python can not compile
+            logger.warning("skip checking %s with the pattern %s : %s", param_name, self.allowed_pattern, ex)
+            self.pattern = None
         self.constraint_description = param_def.get("ConstraintDescription", None)
-        self.max_value = int(param_def.get("MaxLength", sys.maxsize))
-        self.min_value = int(param_def.get("MinLength", 0))
+        self.max_value = float(param_def.get("MaxValue", sys.maxsize))
+        self.min_value = float(param_def.get("MinValue", -sys.maxsize))
         self.max_length = int(param_def.get("MaxLength", sys.maxsize))
         self.min_length = int(param_def.get("MinLength", 0))
         self.no_echo = bool(param_def.get("NoEcho", False))
@@ -161,28 +1396,459 @@ class BaseAwsParameter(ABC):
         self.disabled = False
 
         self.widget = None
-
+        self.loading = False
+        # error of the last failed load, cleared when loading starts again
+        self.load_error = None
+        # last checked value and its errors, reused until the value changes
+        self._checked = None
+        self._validation_timer = None
+        self._show_blank_error = False
+        # search box shown once there are more allowed values than SEARCH_MAX_OPTIONS
+        self.search = None
+        self.complete = True
+        self._searched = []
+        self._search_query = ""
+        self._search_timer = None
+        self.refresh_button = None
+        self._refresh_timer = None
+        # aws region and profile allowed values are listed from, None for the defaults
+        self.region = None
+        self.profile = None
+        # name of the vpc parameter scoping allowed values, and the vpc chosen in it.
+        # a scoped parameter lists nothing until the vpc is chosen
+        self.vpc_parameter = None
+        self.vpc_id = None
+        # callbacks called with the new value whenever the selection changes
+        self._selection_observers = []
+        self._showing_options = False
+
+        if headless:
+            # only the definition is loaded, to check values without widgets
+            return
         self._create_widget()
 
+        self.status = widgets.HTML()
+        self.feedback = widgets.HTML()
+        self.container = widgets.HBox([self.widget, self.status, self.feedback])
+        self.widget.observe(self._on_value_change, names="value")
+        if self.aws_options:
+            self.refresh_button = widgets.Button(
+                icon="refresh", tooltip="list allowed values from aws again", layout={"width": "40px"},
+            )
+            self.refresh_button.on_click(lambda b: self.refresh())
+            self._layout()
+            # the default is selected at once and gets its label once allowed values arrive
+            self._show_options(self._initial_selection())
+            self.set_loading(True)
+
     @abstractmethod
-    def validate(self):
+    def check(self, value) -> list:
+        """
+        return every error message for the value, without touching widgets
+        """
         pass
 
     @abstractmethod
     def _create_widget(self):
         pass
 
-    @abstractmethod
-    def get_value(self):
-        pass
+    def parse_value(self, text:str):
+        # convert a value in parameter files into the form widgets hold
+        return text
+
+    def format_value(self, value) -> str:
+        # convert a value widgets hold into the form written in parameter files
+        return value
+
+    def get_value(self) -> str:
+        return self.format_value(self.widget.value)
 
+    def _default_selection(self):
+        return None if self.default_value is None else str(self.default_value)
+
+    def _initial_selection(self):
+        return self._default_selection() if self.prefilled is None else self.prefilled
+
+    def prefill(self, text:str) -> bool:
+        """
+        select a value given as in parameter files, e.g. saved last time or deployed in a stack
+        - the value is selected again instead of the default whenever allowed values are reset
+        returns False if the value cannot be selected, leaving the widget as it is
+        """
+        try:
+            value = self.parse_value(text)
+        except ValueError:
+            return False
+        if not self.aws_options and len(self.allowed_values) > 0:
+            # AllowedValues may be numbers in templates but are strings in parameter files
+            matched = [v for v in self.allowed_values if str(self.format_value(v)) == str(self.format_value(value))]
+            if len(matched) == 0:
+                return False
+            value = matched[0]
+        self.prefilled = value
+        if self.widget is None:
+            return True
+        if self.aws_options:
+            # selected at once, and labeled once allowed values arrive
+            self._show_options(value)
+        else:
+            self.widget.value = value
+        return True
+
+    def validate(self):
+        errors = self.get_errors()
+        assert len(errors) == 0, errors[0]
+
+    def get_errors(self) -> list:
+        value = self.widget.value
+        if self._checked is None or self._checked[0] != value:
+            self._checked = (value, self.check(value))
+        return self._checked[1]
+
+    def show_errors(self, show_blank:bool=False):
+        # an empty widget is not reported while editing, only once saving has been tried
+        self._show_blank_error = self._show_blank_error or show_blank
+        if self._validation_timer is not None:
+            self._validation_timer.cancel()
+            self._validation_timer = None
+        errors = self.get_errors()
+        if is_blank(self.widget.value) and not self._show_blank_error:
+            errors = []
+        self.feedback.value = format_errors(errors)
+        return errors
+
+    def _on_value_change(self, change):
+        if self._validation_timer is not None:
+            self._validation_timer.cancel()
+        self._validation_timer = call_later(VALIDATION_DEBOUNCE_SECONDS, self.show_errors)
+        if not self._showing_options:
+            self._notify_selection()
+
+    def observe_selection(self, callback):
+        # unlike observing the widget, callbacks are not called while options are being replaced
+        self._selection_observers.append(callback)
+
+    def _notify_selection(self):
+        for callback in self._selection_observers:
+            callback(self.widget.value)
 
     def update_state(self, state:bool):
         self.widget.disabled = state
 
+    def set_loading(self, loading:bool):
+        self.loading = loading
+        if loading:
+            self.load_error = None
+        self.widget.disabled = loading or self.disabled
+        self.status.value = "<i>loading...</i>" if loading else self._idle_status()
+        if self.refresh_button is not None:
+            self.refresh_button.disabled = loading
+
+    def fail_loading(self, error:Exception):
+        # leave the loading state with the error shown, so that the refresh button can retry
+        logger.error("failed to load allowed values of %s : %s", self.name, error)
+        self.set_loading(False)
+        self.load_error = error
+        self.status.value = f"<font color='red'>failed to load : {html.escape(str(error))}</font>"
+
+    def _idle_status(self) -> str:
+        return f"<i>select {html.escape(self.vpc_parameter)} first</i>" if self.waiting_for_vpc() else ""
+
+    def _clear_status(self):
+        if not self.loading:
+            self.status.value = self._idle_status()
+
+    def _target(self) -> tuple:
+        # pages listed for a target switched away from in the meantime are dropped
+        return (self.region, self.profile, self.vpc_id)
+
+    def waiting_for_vpc(self) -> bool:
+        return self.vpc_parameter is not None and self.vpc_id is None
+
+    def _layout(self):
+        self.container.children = tuple(
+            w for w in (self.widget, self.search, self.refresh_button, self.status, self.feedback) if w is not None
+        )
+
+    def load_allowed_values_from_aws(self, push=None):
+        # push each page of allowed values into the widget as it arrives,
+        # but not more often than OPTIONS_FLUSH_INTERVAL
+        if push is None:
+            push = self.add_allowed_values
+        pending = []
+        flushed_at = None
+        count = 0
+        pages = self._iter_allowed_values_from_aws()
+        with tracer.span(f"options {self.name}", "widget", type=self.type) as span:
+            try:
+                for values in pages:
+                    pending.extend(values)
+                    count += len(values)
+                    if flushed_at is None or monotonic() - flushed_at >= OPTIONS_FLUSH_INTERVAL:
+                        push(pending)
+                        pending = []
+                        flushed_at = monotonic()
+            finally:
+                pages.close()
+            if len(pending) > 0:
+                push(pending)
+            span.update(items=count, complete=self.complete)
+
+    async def load_allowed_values_from_aws_async(self, executor:ThreadPoolExecutor):
+        # list aws resources on a worker thread, but touch the widget only on the event loop
+        loop = asyncio.get_running_loop()
+        target = self._target()
+        def add_allowed_values(values:list):
+            if self._target() == target:
+                self.add_allowed_values(values)
+        def push(values:list):
+            loop.call_soon_threadsafe(add_allowed_values, values)
+        try:
+            await loop.run_in_executor(executor, self.load_allowed_values_from_aws, push)
+        except Exception as ex:
+            if self._target() == target:
+                self.fail_loading(ex)
+            else:
+                logger.error("failed to load allowed values of %s : %s", self.name, ex)
+            return
+        if self._target() == target:
+            self.set_loading(False)
+
+    def add_allowed_values(self, pairs:list):
+        for value, label in pairs:
+            if value not in self.allowed_labels:
+                self.allowed_values.append(value)
+            self.allowed_labels[value] = label
+        self._show_options(self.widget.value)
+
+    def set_allowed_values(self, pairs:list):
+        self.allowed_labels = {value: label for value, label in pairs}
+        self.allowed_values = list(self.allowed_labels)
+        # keep the current selection as long as it is still allowed
+        allowed = self.allowed_labels.keys() | set(value for _, value in self._searched)
+        value = self.widget.value
+        if isinstance(value, tuple):
+            value = tuple(v for v in value if v in allowed)
+        elif value not in allowed:
+            value = None
+        self._show_options(value)
+
+    def _show_options(self, value):
+        # only the top matches of the search query are sent to the browser, selected values are always kept
+        if self.search is None and (len(self.allowed_values) > SEARCH_MAX_OPTIONS or not self.complete):
+            self._create_search_box()
+        if self.search is not None:
+            self.search.placeholder = "search on aws..." if not self.complete else f"search {len(self.allowed_values)} values..."
+        # options are (label, value) pairs, values found on aws already match the query by their filters
+        options = match_options(
+            [(self.allowed_labels.get(v, v), v) for v in self.allowed_values], self._search_query, SEARCH_MAX_OPTIONS,
+        )
+        options = list(dict((v, (label, v)) for label, v in options + self._searched).values())[:SEARCH_MAX_OPTIONS]
+        shown = set(v for _, v in options)
+        selection = value if isinstance(value, tuple) else () if value is None else (value,)
+        options.extend((self.allowed_labels.get(v, v), v) for v in selection if v not in shown)
+        # replacing options resets the selection, so set it again
+        selected = self.widget.value
+        self._showing_options = True
+        try:
+            self.widget.options = tuple(options)
+            self.widget.value = value
+        finally:
+            self._showing_options = False
+        if self.widget.value != selected:
+            self._notify_selection()
+
+    def _create_search_box(self):
+        self.search = widgets.Text(
+            continuous_update=True,
+            layout={"width": "200px"},
+        )
+        self.search.observe(self._on_search_change, names="value")
+        self._layout()
+
+    def _on_search_change(self, change):
+        if self._search_timer is not None:
+            self._search_timer.cancel()
+        self._search_timer = call_later(SEARCH_DEBOUNCE_SECONDS, self.search_allowed_values)
+
+    def search_allowed_values(self):
+        self._search_timer = None
+        query = self.search.value.strip()
+        if query != self._search_query:
+            self._searched = []
+        self._search_query = query
+        self._show_options(self.widget.value)
+        if self.complete or not query:
+            return
+        # the listing was cut short, so the query is pushed down to aws
+        def on_searched(values:list):
+            if query != self._search_query:
+                return
+            self._searched = values
+            self._show_options(self.widget.value)
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            on_searched(self.search_allowed_values_on_aws(query))
+            return
+        future = loop.run_in_executor(get_executor(), self.search_allowed_values_on_aws, query)
+        future.add_done_callback(lambda f: on_searched(f.result()) if f.exception() is None else logger.error(
+            "failed to search allowed values of %s : %s", self.name, f.exception()
+        ))
+
+    def search_allowed_values_on_aws(self, query:str) -> list:
+        return [(label, value) for value, label in allowed_values_resolver.search(
+            self.type, query, SEARCH_MAX_OPTIONS, self.region, self.profile,
+        )]
+
+    def _iter_allowed_values_from_aws(self):
+        # (id, label) pairs, ids are what get_value returns.
+        # types searched on aws are listed only up to SEARCH_MAX_OPTIONS, the others are found by searching
+        if self.waiting_for_vpc():
+            return
+        max_items = SEARCH_MAX_OPTIONS if allowed_values_resolver.searchable(self.type) else None
+        yield from allowed_values_resolver.iter_pages(self.type, self.region, self.profile, self.vpc_id, max_items)
+        self.complete = max_items is None or allowed_values_resolver.complete(self.type, self.region, self.profile, self.vpc_id)
+
+    def list_allowed_values_from_aws(self) -> list:
+        return [value for values in self._iter_allowed_values_from_aws() for value in values]
+
+    def vpc_scope(self, resource_type:str) -> str:
+        # the vpc the resource type is listed within, None for the whole region
+        return self.vpc_id if resource_type in VPC_SCOPED_RESOURCES and self.vpc_parameter is not None else None
+
+    def stale_resources(self) -> set:
+        # resource types of this parameter whose cached listings are stale
+        if self.waiting_for_vpc():
+            return set()
+        return set(
+            resource_type for resource_type in get_parameter_type_resources(self.type)
+            if inventory.is_stale(
+                resource_type, client_pool.get_client(inventory.services[resource_type], self.region, self.profile),
+                self.vpc_scope(resource_type),
+            )
+        )
+
+    def refresh_allowed_values_from_aws(self, resource_types:set=None) -> list:
+        """
+        list resources of this parameter again, then resolve its allowed (id, label) pairs from them
+        - resource_types: listings made again, all of the parameter type's if None
+        - listings cut short for search are listed again only as far as they were
+        """
+        if resource_types is None:
+            resource_types = get_parameter_type_resources(self.type)
+        if self.waiting_for_vpc():
+            resource_types = set()
+        for resource_type in sorted(resource_types):
+            client = client_pool.get_client(inventory.services[resource_type], self.region, self.profile)
+            if resource_type in SEARCH_RESOURCES and inventory.fetched_at(resource_type, client) is None:
+                continue
+            inventory.get_entry(resource_type, client, refresh=True, vpc_id=self.vpc_scope(resource_type))
+        pairs = []
+        self.load_allowed_values_from_aws(pairs.extend)
+        return pairs
+
+    def patch_allowed_values(self, pairs:list) -> tuple:
+        """
+        apply differences between listed (id, label) pairs and current options
+        - the widget is left untouched if nothing has changed
+        - the selection is kept unless its resource has gone
+        returns ids added and removed
+        """
+        labels = dict(pairs)
+        added = [v for v in labels if v not in self.allowed_labels]
+        removed = set(v for v in self.allowed_labels if v not in labels)
+        relabeled = any(self.allowed_labels[v] != label for v, label in labels.items() if v in self.allowed_labels)
+        if len(added) == 0 and len(removed) == 0 and not relabeled:
+            return added, removed
+        self.allowed_values = [v for v in self.allowed_values if v not in removed] + added
+        self.allowed_labels = labels
+        value = self.widget.value
+        if isinstance(value, tuple):
+            value = tuple(v for v in value if v not in removed)
+        elif value in removed:
+            value = None
+        self._show_options(value)
+        return added, removed
+
+    def refresh(self, resource_types:set=None, executor:ThreadPoolExecutor=None):
+        """
+        list allowed values from aws again and patch the widget with differences
+        - listing runs on a worker thread, the widget is touched only on the event loop
+        """
+        target = self._target()
+        self.refresh_button.disabled = True
+        self.status.value = "<i>refreshing...</i>"
+
+        def on_refreshed(pairs:list=None, error:Exception=None):
+            self.refresh_button.disabled = self.loading
+            if self._target() != target:
+                return
+            if error is not None:
+                logger.error("failed to refresh allowed values of %s : %s", self.name, error)
+                self.status.value = f"<font color='red'>failed to refresh : {html.escape(str(error))}</font>"
+                return
+            added, removed = self.patch_allowed_values(pairs)
+            self.load_error = None
+            self.status.value = f"<i>+{len(added)} -{len(removed)}</i>"
+            if self._refresh_timer is not None:
+                self._refresh_timer.cancel()
+            self._refresh_timer = call_later(STATUS_MESSAGE_SECONDS, self._clear_status)
+
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            try:
+                on_refreshed(pairs=self.refresh_allowed_values_from_aws(resource_types))
+            except Exception as ex:
+                on_refreshed(error=ex)
+            return
+        future = loop.run_in_executor(executor or get_executor(), self.refresh_allowed_values_from_aws, resource_types)
+        future.add_done_callback(
+            lambda f: on_refreshed(error=f.exception()) if f.exception() is not None else on_refreshed(pairs=f.result())
+        )
+
+    def set_target(self, region:str, profile:str):
+        """
+        list allowed values from another region or profile from now on
+        - values listed so far are dropped and the default (or prefilled value) is selected again,
+          as ids of aws resources differ between regions and accounts
+        """
+        self.region = region
+        self.profile = profile
+        self._reset_allowed_values()
+
+    def set_vpc(self, vpc_id:str):
+        """
+        list allowed values within another vpc from now on, or nothing until a vpc is chosen if None
+        - values listed so far are dropped and the default is selected again
+        """
+        self.vpc_id = vpc_id or None
+        self._reset_allowed_values()
+
+    def _reset_allowed_values(self):
+        self.allowed_values = list(self.param_def.get("AllowedValues", []))
+        self.allowed_labels = dict()
+        self.complete = True
+        self._searched = []
+        if self.widget is not None:
+            self._show_options(self._initial_selection())
+            self.set_loading(True)
+
+    async def reload_allowed_values_from_aws_async(self, executor:ThreadPoolExecutor):
+        loop = asyncio.get_running_loop()
+        target = self._target()
+        try:
+            values = await loop.run_in_executor(executor, self.list_allowed_values_from_aws)
+        except Exception as ex:
+            logger.error("failed to reload allowed values of %s : %s", self.name, ex)
+            return
+        if self._target() == target:
+            self.set_allowed_values(values)
+
 class StringParameter(BaseAwsParameter):
-    def __init__(self, param_name: str, param_def: dict) -> None:
-        super().__init__(param_name, param_def)
+    def __init__(self, param_name: str, param_def: dict, **kwargs) -> None:
+        super().__init__(param_name, param_def, **kwargs)
 
     def _create_widget(self):
         pattern = self.allowed_pattern if self.allowed_pattern != ".*" else ""
@@ -196,7 +1862,11 @@ class StringParameter(BaseAwsParameter):
             disabled=self.disabled,
             placeholder=pattern,
         )
-        if len(self.allowed_values) > 0:
+        if self.aws_options:
+            kwargs["options"] = []
+            kwargs["value"] = None
+            w = widgets.Dropdown
+        elif len(self.allowed_values) > 0:
             kwargs["options"] = self.allowed_values
             w = widgets.Dropdown
         elif self.no_echo:
@@ -206,28 +1876,27 @@ class StringParameter(BaseAwsParameter):
 
         self.widget = w(**kwargs)
 
-    def validate(self):
-        val = self.widget.value
+    def check(self, value) -> list:
         name = self.name
         pattern = self.allowed_pattern if self.constraint_description is None else self.constraint_description
 
-        assert bool(val), f"{name} is empty"
-        assert len(val) <= self.max_length, f"{name}'s length must be smaller equal than {self.max_length}"
-        assert len(val) >= self.min_length, f"{name}'s length must be greater equal than {self.min_length}"
-        assert re.match(self.allowed_pattern, val), f"{name} must match the pattern : {pattern}"
-
-    def get_value(self):
-        return self.widget.value
+        if not value:
+            return [f"{name} is empty"]
+        errors = []
+        if len(value) > self.max_length:
+            errors.append(f"{name}'s length must be smaller equal than {self.max_length}")
+        if len(value) < self.min_length:
+            errors.append(f"{name}'s length must be greater equal than {self.min_length}")
+        if self.pattern is not None and not self.pattern.match(value):
+            errors.append(f"{name} must match the pattern : {pattern}")
+        return errors
 
 class MultipleStringParameter(BaseAwsParameter):
-    def __init__(self, param_name: str, param_def: dict) -> None:
-        super().__init__(param_name, param_def)
+    def __init__(self, param_name: str, param_def: dict, **kwargs) -> None:
+        super().__init__(param_name, param_def, **kwargs)
 
     def _create_widget(self):
-        if self.default_value is None:
-            value = []
-        else:
-            value = self.default_value
+        value = () if self.aws_options else self._default_selection()
         kwargs = dict(
             description=self.description_fmt.format(
                 name=self.name, description=self.description,
@@ -241,18 +1910,25 @@ class MultipleStringParameter(BaseAwsParameter):
 
         self.widget = widgets.SelectMultiple(**kwargs)
 
-    def validate(self):
-        val = self.widget.value
-        name = self.name
+    def _default_selection(self) -> tuple:
+        if self.default_value is None:
+            return ()
+        return tuple(str(self.default_value).split(","))
 
-        assert len(val) != 0, f"{name} is empty"
+    def check(self, value) -> list:
+        if len(value) == 0:
+            return [f"{self.name} is empty"]
+        return []
 
-    def get_value(self):
-        return ",".join(self.widget.value)
+    def parse_value(self, text:str) -> tuple:
+        return tuple(text.split(",")) if text else ()
+
+    def format_value(self, value) -> str:
+        return ",".join(value)
 
 class NumberParameter(BaseAwsParameter):
-    def __init__(self, param_name: str, param_def: dict) -> None:
-        super().__init__(param_name, param_def)
+    def __init__(self, param_name: str, param_def: dict, **kwargs) -> None:
+        super().__init__(param_name, param_def, **kwargs)
 
 
     def _create_widget(self):
@@ -273,21 +1949,31 @@ class NumberParameter(BaseAwsParameter):
 
         self.widget = w(**kwargs)
 
-    def validate(self):
-        val = self.widget.value
+    def check(self, value) -> list:
         name = self.name
 
-        assert val is not None, f"{name} is empty"
-        assert val <= self.max_value, f"{name}'s value must be smaller equal than {self.max_value}"
-        assert val >= self.min_value, f"{name}'s value must be greater equal than {self.min_value}"
+        if value is None:
+            return [f"{name} is empty"]
+        errors = []
+        if float(value) > self.max_value:
+            errors.append(f"{name}'s value must be smaller equal than {self.max_value:g}")
+        if float(value) < self.min_value:
+            errors.append(f"{name}'s value must be greater equal than {self.min_value:g}")
+        return errors
+
+    def parse_value(self, text:str) -> float:
+        return float(text)
 
-    def get_value(self):
-        return str(self.widget.value)
+    def format_value(self, value) -> str:
+        # integral values are written without a fraction, as cfn compares them with AllowedValues as strings
+        if float(value).is_integer():
+            return str(int(float(value)))
+        return str(value)
 
 
 class CdlParameter(BaseAwsParameter):
-    def __init__(self, param_name: str, param_def: dict) -> None:
-        super().__init__(param_name, param_def)
+    def __init__(self, param_name: str, param_def: dict, **kwargs) -> None:
+        super().__init__(param_name, param_def, **kwargs)
 
     def _create_widget(self):
         kwargs = dict(
@@ -302,19 +1988,15 @@ class CdlParameter(BaseAwsParameter):
         )
         self.widget = widgets.Text(**kwargs)
 
-    def validate(self):
-        val = self.widget.value
-        name = self.name
-
-        assert val is not None, f"{name} is empty"
-
-    def get_value(self):
-        return self.widget.value
+    def check(self, value) -> list:
+        if value is None:
+            return [f"{self.name} is empty"]
+        return []
 
 
 class ListNumberParameter(BaseAwsParameter):
-    def __init__(self, param_name: str, param_def: dict) -> None:
-        super().__init__(param_name, param_def)
+    def __init__(self, param_name: str, param_def: dict, **kwargs) -> None:
+        super().__init__(param_name, param_def, **kwargs)
 
     def _create_widget(self):
         kwargs = dict(
@@ -329,398 +2011,592 @@ class ListNumberParameter(BaseAwsParameter):
         )
         self.widget = widgets.Text(**kwargs)
 
-    def validate(self):
-        val = self.widget.value
+    def check(self, value) -> list:
         name = self.name
 
-        assert val is not None, f"{name} is empty"
+        if value is None:
+            return [f"{name} is empty"]
         try:
-            _ = [float(v) for v in val.split(",")]
+            _ = [float(v) for v in value.split(",")]
         except ValueError:
-            raise AssertionError(f"{name} must be list of numbers")
-
-    def get_value(self):
-        return self.widget.value
+            return [f"{name} must be list of numbers"]
+        return []
 
 class AwsAzParameters(StringParameter):
-    def __init__(self, param_name: str, param_def: dict) -> None:
-        self.client = boto3.client("ec2")        
-        param_def["AllowedValues"] = self._get_allowed_value_from_aws()
-
-        super().__init__(param_name, param_def)
-
-    def _get_allowed_value_from_aws(self):
-        # get available availability zones
-        response = self.client.describe_availability_zones(
-            Filters=[{"Name": "state", "Values": ["available"]}]
-        )
-        return [az["ZoneName"] for az in response["AvailabilityZones"]]
+    aws_options = True
 
 class AwsAzListParameter(MultipleStringParameter):
-    def __init__(self, param_name: str, param_def: dict) -> None:
-        self.client = boto3.client("ec2")        
-        param_def["AllowedValues"] = self._get_allowed_value_from_aws()
-        super().__init__(param_name, param_def)
-
-    def _get_allowed_value_from_aws(self):
-        # get available availability zones
-        response = self.client.describe_availability_zones(
-            Filters=[{"Name": "state", "Values": ["available"]}]
-        )
-        return [az["ZoneName"] for az in response["AvailabilityZones"]]
+    aws_options = True
 
 
 class AwsSsmNameParameters(StringParameter):
-    def __init__(self, param_name: str, param_def: dict) -> None:
-        self.client = boto3.client("ssm")        
-        param_def["AllowedValues"] = self._get_allowed_value_from_aws()
-
-        super().__init__(param_name, param_def)
-
-    def _get_allowed_value_from_aws(self):
-        # get available availability zones
-        response = self.client.describe_parameters()
-        return [param["Name"] for param in response["Parameters"]]
+    aws_options = True
 
 
 class AwsSsmValueParameters(StringParameter):
-    def __init__(self, param_name: str, param_def: dict) -> None:
-        self.client = boto3.client("ssm")        
-        param_def["AllowedValues"] = self._get_allowed_value_from_aws()
-
-        super().__init__(param_name, param_def)
-
-    def _get_allowed_value_from_aws(self):
-        response = self.client.describe_parameters(Filters=[
-            {"Key" : "Type", "Values": ["String"]}
-        ])
-        response = self.client.get_parameters(
-            Names=[param["Name"] for param in response["Parameters"]],
-        )
-        return [f"{param['Name']} | {param['Value']}" for param in response["Parameters"]]
+    aws_options = True
 
-    def get_value(self):
-        return self.widget.value.split(" | ")[0]
 
 class AwsSsmValueListParameters(StringParameter):
-    def __init__(self, param_name: str, param_def: dict) -> None:
-        self.client = boto3.client("ssm")        
-        param_def["AllowedValues"] = self._get_allowed_value_from_aws()
-
-        super().__init__(param_name, param_def)
-
-    def _get_allowed_value_from_aws(self):
-        response = self.client.describe_parameters(Filters=[
-            {"Key" : "Type", "Values": ["StringList"]}
-        ])
-        response = self.client.get_parameters(
-            Names=[param["Name"] for param in response["Parameters"]],
-        )
-        return [f"{param['Name']} | {param['Value']}" for param in response["Parameters"]]
-
-    def get_value(self):
-        return self.widget.value.split(" | ")[0]
+    aws_options = True
 
 
 class AwsSsmValueCdlParameters(StringParameter):
-    def __init__(self, param_name: str, param_def: dict) -> None:
-        self.client = boto3.client("ssm")        
-        param_def["AllowedValues"] = self._get_allowed_value_from_aws()
+    aws_options = True
 
-        super().__init__(param_name, param_def)
-
-    def _get_allowed_value_from_aws(self):
-        response = self.client.describe_parameters(Filters=[
-            {"Key" : "Type", "Values": ["StringList"]}
-        ])
-        response = self.client.get_parameters(
-            Names=[param["Name"] for param in response["Parameters"]],
-        )
-        return [f"{param['Name']} | {param['Value']}" for param in response["Parameters"]]
-
-    def get_value(self):
-        return self.widget.value.split(" | ")[0]
 
+AMI_ID_PATTERN = "(^ami-[0-9a-z]{17}$)|(^ami-[0-9a-z]{8}$)"
+# amis are not listed, so ssm parameters holding them are checked by the pattern
+allowed_values_resolver.register_pattern("AWS::EC2::Image::Id", AMI_ID_PATTERN)
 
 class AwsAmiParameter(StringParameter):
-    def __init__(self, param_name: str, param_def: dict) -> None:
-        # self.client = boto3.client("ec2")        
-        # param_def["AllowedValues"] = self._get_allowed_value_from_aws()
-        param_def["AllowedPattern"] = "(^ami-[0-9a-z]{17}$)|(^ami-[0-9a-z]{8}$)"
-        super().__init__(param_name, param_def)
+    def __init__(self, param_name: str, param_def: dict, **kwargs) -> None:
+        param_def["AllowedPattern"] = AMI_ID_PATTERN
+        super().__init__(param_name, param_def, **kwargs)
 
 
 class AwsInstanceIdParameter(StringParameter):
-    def __init__(self, param_name: str, param_def: dict) -> None:
-        self.client = boto3.client("ec2")        
-        param_def["AllowedValues"] = self._get_allowed_value_from_aws()
-        super().__init__(param_name, param_def)
-
-    def _get_allowed_value_from_aws(self):
-        response = self.client.describe_instances()
-        return [f"{instance['InstanceId']} | {get_instance_name(instance['InstanceId'], self.client)}"
-            for reservation in response["Reservations"]
-            for instance in reservation["Instances"]
-        ]
-    def get_value(self):
-        return self.widget.value.split(" | ")[0]
+    aws_options = True
 
-class AwsKeyNameParameter(StringParameter):
-    def __init__(self, param_name: str, param_def: dict) -> None:
-        self.client = boto3.client("ec2")        
-        param_def["AllowedValues"] = self._get_allowed_value_from_aws()
-        super().__init__(param_name, param_def)
 
-    def _get_allowed_value_from_aws(self):
-        response = self.client.describe_key_pairs()
-        return [key["KeyName"] for key in response["KeyPairs"]]
+class AwsKeyNameParameter(StringParameter):
+    aws_options = True
 
 class AwsSecurityGroupNameParameter(StringParameter):
-    def __init__(self, param_name: str, param_def: dict) -> None:
-        self.client = boto3.client("ec2")        
-        param_def["AllowedValues"] = self._get_allowed_value_from_aws()
-        super().__init__(param_name, param_def)
+    aws_options = True
 
-    def _get_allowed_value_from_aws(self):
-        response = self.client.describe_security_groups()
-        return [
-            f"{sg['GroupName']} | {get_vpc_name(sg['VpcId'], self.client)}"
-            for sg in response["SecurityGroups"]
-        ]
-    def get_value(self):
-        return self.widget.value.split(" | ")[0]
 
 class AwsSecurityGroupIdParameter(StringParameter):
-    def __init__(self, param_name: str, param_def: dict) -> None:
-        self.client = boto3.client("ec2")        
-        param_def["AllowedValues"] = self._get_allowed_value_from_aws()
-        super().__init__(param_name, param_def)
+    aws_options = True
 
-    def _get_allowed_value_from_aws(self):
-        response = self.client.describe_security_groups()
-        return [
-            f"{sg['GroupId']}({sg['GroupName']}) | {get_vpc_name(sg['VpcId'], self.client)}"
-            for sg in response["SecurityGroups"]
-        ]
-
-    def get_value(self):
-        return self.widget.value.split("(")[0]
 
 class AwsVolumeIdParameter(StringParameter):
-    def __init__(self, param_name: str, param_def: dict) -> None:
-        self.client = boto3.client("ec2")        
-        param_def["AllowedValues"] = self._get_allowed_value_from_aws()
-        super().__init__(param_name, param_def)
+    aws_options = True
 
-    def _get_allowed_value_from_aws(self):
-        response = self.client.describe_volumes()
-        return [
-            f"{volume['VolumeId']} | {get_volume_name(volume['VolumeId'], self.client)}"
-            for volume in response["Volumes"]
-        ]
-    def get_value(self):
-        return self.widget.value.split(" | ")[0]
 
 class AwsSubnetIdParameter(StringParameter):
-    def __init__(self, param_name: str, param_def: dict) -> None:
-        self.client = boto3.client("ec2")        
-        param_def["AllowedValues"] = self._get_allowed_value_from_aws()
-        super().__init__(param_name, param_def)
+    aws_options = True
 
-    def _get_allowed_value_from_aws(self):
-        response = self.client.describe_subnets()
-        return [
-            f"{subnet['SubnetId']}({get_subnet_name(subnet['SubnetId'], self.client)}) | {get_vpc_name(subnet['VpcId'], self.client)}"
-            for subnet in response["Subnets"]
-        ]
-
-    def get_value(self):
-        return self.widget.value.split("(")[0]
 
 class AwsVpcIdParameter(StringParameter):
-    def __init__(self, param_name: str, param_def: dict) -> None:
-        self.client = boto3.client("ec2")        
-        param_def["AllowedValues"] = self._get_allowed_value_from_aws()
-        super().__init__(param_name, param_def)
-
-    def _get_allowed_value_from_aws(self):
-        response = self.client.describe_vpcs()
-        return [
-            f"{vpc['VpcId']} | {get_vpc_name(vpc['VpcId'], self.client)}"
-            for vpc in response["Vpcs"]
-        ]
+    aws_options = True
 
-    def get_value(self):
-        return self.widget.value.split(" | ")[0]
 
 class AwsHostedZoneIdParameter(StringParameter):
-    def __init__(self, param_name: str, param_def: dict) -> None:
-        self.client = boto3.client("route53")        
-        param_def["AllowedValues"] = self._get_allowed_value_from_aws()
-        super().__init__(param_name, param_def)
+    aws_options = True
 
-    def _get_allowed_value_from_aws(self):
-        response = self.client.list_hosted_zones()
-        return [
-            f"{zone['Id'].split('/')[-1]} | {zone['Name']}"
-            for zone in response["HostedZones"]
-        ]
-
-    def get_value(self):
-        return self.widget.value.split(" | ")[0]
 
 class AwsAzNameListParameter(MultipleStringParameter):
-    def __init__(self, param_name: str, param_def: dict) -> None:
-        param_def["AllowedValues"] = AwsAzParameters(param_name, param_def).allowed_values
-        super().__init__(param_name, param_def)
+    aws_options = True
 
 class AwsAmiIdListParameter(CdlParameter):
-    def __init__(self, param_name: str, param_def: dict) -> None:
-        param_def["AllowedPattern"] = AwsAmiParameter(param_name, param_def).allowed_pattern
-        super().__init__(param_name, param_def)
-    def validate(self):
-        for val in self.widget.value.split(","):
-            assert re.match(self.allowed_pattern, val), f"{val} must be a form of {self.allowed_pattern}"
-        return super().validate()
+    def __init__(self, param_name: str, param_def: dict, **kwargs) -> None:
+        param_def["AllowedPattern"] = AMI_ID_PATTERN
+        super().__init__(param_name, param_def, **kwargs)
+    def check(self, value) -> list:
+        errors = super().check(value)
+        if len(errors) > 0:
+            return errors
+        return [
+            f"{val} must be a form of {self.allowed_pattern}"
+            for val in value.split(",") if self.pattern is not None and not self.pattern.match(val)
+        ]
 
 class AwsInstanceIdListParameter(MultipleStringParameter):
-    def __init__(self, param_name: str, param_def: dict) -> None:
-        param_def["AllowedValues"] = AwsInstanceIdParameter(param_name, param_def).allowed_values
-        super().__init__(param_name, param_def)
+    aws_options = True
 
-    def get_value(self):
-        return ",".join([v.split(" | ")[0] for v in self.widget.value])
 
 class AwsSecurityGroupNameListParameter(MultipleStringParameter):
-    def __init__(self, param_name: str, param_def: dict) -> None:
-        param_def["AllowedValues"] = AwsSecurityGroupNameParameter(param_name, param_def).allowed_values
-        super().__init__(param_name, param_def)
+    aws_options = True
 
-    def get_value(self):
-        return ",".join([v.split(" | ")[0] for v in self.widget.value])
 
 class AwsSecurityGroupIdListParameter(MultipleStringParameter):
-    def __init__(self, param_name: str, param_def: dict) -> None:
-        param_def["AllowedValues"] = AwsSecurityGroupIdParameter(param_name, param_def).allowed_values
-        super().__init__(param_name, param_def)
+    aws_options = True
 
-    def get_value(self):
-        return ",".join([v.split("(")[0] for v in self.widget.value])
 
 class AwsSubnetIdListParameter(MultipleStringParameter):
-    def __init__(self, param_name: str, param_def: dict) -> None:
-        param_def["AllowedValues"] = AwsSubnetIdParameter(param_name, param_def).allowed_values
-        super().__init__(param_name, param_def)
+    aws_options = True
 
-    def get_value(self):
-        return ",".join([v.split("(")[0] for v in self.widget.value])
 
 class AwsVolumeIdListParameter(MultipleStringParameter):
-    def __init__(self, param_name: str, param_def: dict) -> None:
-        param_def["AllowedValues"] = AwsVolumeIdParameter(param_name, param_def).allowed_values
-        super().__init__(param_name, param_def)
+    aws_options = True
 
-    def get_value(self):
-        return ",".join([v.split(" | ")[0] for v in self.widget.value])
 
 class AwsVpcIdListParameter(MultipleStringParameter):
-    def __init__(self, param_name: str, param_def: dict) -> None:
-        param_def["AllowedValues"] = AwsVpcIdParameter(param_name, param_def).allowed_values
-        super().__init__(param_name, param_def)
+    aws_options = True
 
-    def get_value(self):
-        return ",".join([v.split(" | ")[0] for v in self.widget.value])
 
 class AwsHostedZoneIdListParameter(MultipleStringParameter):
-    def __init__(self, param_name: str, param_def: dict) -> None:
-        param_def["AllowedValues"] = AwsHostedZoneIdParameter(param_name, param_def).allowed_values
-        super().__init__(param_name, param_def)
-
-    def get_value(self):
-        return ",".join([v.split(" | ")[0] for v in self.widget.value])
+    aws_options = True
 
 
 class AwsSsmSpecificParameters(StringParameter):
-    def __init__(self, param_name: str, param_def: dict) -> None:
-        self.client = boto3.client("ssm")
-        self.param_def = param_def
-        self.type = param_def["Type"]
-        self.name = param_name
-        param_def["AllowedValues"] = self._get_allowed_value_from_aws()
+    aws_options = True
 
-        super().__init__(param_name, param_def)
-
-    def _get_allowed_value_from_aws(self):
-        response = self.client.describe_parameters(Filters=[
-            {"Key" : "Type", "Values": ["String"]}
-        ])
-        response = self.client.get_parameters(
-            Names=[param["Name"] for param in response["Parameters"]],
-        )
-        aws_type = self.type[len("AWS::SSM::Parameter::Value<"):-1]
-        allowed_values = AwsExtension.parameter_widgets[aws_type](self.name, self.param_def).allowed_values
-        allowed_values = [val.split(" | ")[0].split("(")[0] for val in allowed_values]
-        return [
-            f"{param['Name']} | {param['Value']}" for param in response["Parameters"]
-            if param["Value"] in allowed_values
-        ]
-    def get_value(self):
-        return self.widget.value.split(" | ")[0]
 
 class AwsSsmSpecificListParameters(StringParameter):
-    def __init__(self, param_name: str, param_def: dict) -> None:
-        self.client = boto3.client("ssm")
-        self.param_def = param_def
-        self.type = param_def["Type"]
-        self.name = param_name
-        param_def["AllowedValues"] = self._get_allowed_value_from_aws()
+    aws_options = True
 
-        super().__init__(param_name, param_def)
 
-    def _get_allowed_value_from_aws(self):
-        response = self.client.describe_parameters(Filters=[
-            {"Key" : "Type", "Values": ["StringList"]}
-        ])
-        response = self.client.get_parameters(
-            Names=[param["Name"] for param in response["Parameters"]],
+class AwsSsmListSpecificParameters(StringParameter):
+    aws_options = True
+
+
+def call_later(delay:float, callback):
+    """
+    run callback after delay seconds without blocking the caller
+    - on the kernel's event loop if it is running, otherwise on a timer thread
+    - returns a handle which can be cancelled
+    """
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        timer = threading.Timer(delay, callback)
+        timer.daemon = True
+        timer.start()
+        return timer
+    return loop.call_later(delay, callback)
+
+def write_file_if_changed(path:str, content:str) -> bool:
+    """
+    atomically replace the file with given content through a temp file and rename
+    returns False without writing if the file already has the same content hash
+    """
+    data = content.encode("utf-8")
+    try:
+        with open(path, "rb") as fp:
+            if hashlib.sha256(fp.read()).digest() == hashlib.sha256(data).digest():
+                return False
+        mode = os.stat(path).st_mode & 0o777
+    except FileNotFoundError:
+        mode = 0o644
+
+    fd, tmp_path = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(path)), prefix=f".{os.path.basename(path)}.", suffix=".tmp",
+    )
+    try:
+        with os.fdopen(fd, "wb") as fp:
+            fp.write(data)
+            fp.flush()
+            os.fsync(fp.fileno())
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    return True
+
+
+def _construct_cfn_tag(loader:yaml.SafeLoader, tag_suffix:str, node:yaml.Node) -> dict:
+    # short form tags read the same as cfn_flip does, e.g. `!Ref x` into {"Ref": x}
+    if tag_suffix not in ("Ref", "Condition"):
+        tag_suffix = f"Fn::{tag_suffix}"
+    if tag_suffix == "Fn::GetAtt":
+        value = node.value.split(".", 1) if isinstance(node.value, str) else [n.value for n in node.value]
+    elif isinstance(node, yaml.ScalarNode):
+        value = loader.construct_scalar(node)
+    elif isinstance(node, yaml.SequenceNode):
+        value = loader.construct_sequence(node, deep=True)
+    else:
+        value = loader.construct_mapping(node, deep=True)
+    return {tag_suffix: value}
+
+def _construct_timestamp(loader:yaml.SafeLoader, node:yaml.Node) -> str:
+    # dates are left as strings, as in json converted by cfn_flip
+    return yaml.constructor.SafeConstructor.construct_yaml_timestamp(loader, node).isoformat()
+
+@lru_cache(maxsize=None)
+def _template_loader() -> type:
+    """
+    yaml loader of cfn templates, composing nodes out of parser events one section at a time
+    - the libyaml C parser is used where available
+    """
+    base = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+    bases = (base, ) if issubclass(base, yaml.composer.Composer) else (base, yaml.composer.Composer)
+    loader = type("CfnTemplateLoader", bases, {})
+    loader.add_multi_constructor("!", _construct_cfn_tag)
+    loader.add_constructor("tag:yaml.org,2002:timestamp", _construct_timestamp)
+    return loader
+
+def _skip_node(loader:yaml.SafeLoader):
+    # consume events of a node without building it
+    depth = 0
+    while True:
+        event = loader.get_event()
+        if isinstance(event, (yaml.MappingStartEvent, yaml.SequenceStartEvent)):
+            depth += 1
+        elif isinstance(event, (yaml.MappingEndEvent, yaml.SequenceEndEvent)):
+            depth -= 1
+        if depth == 0:
+            return
+
+def parse_yaml_sections(text:str, sections:tuple=TEMPLATE_SECTIONS) -> dict:
+    """
+    construct only given top-level sections of a yaml cfn template
+    - values are the same as json converted by cfn_flip, short form tags included
+    - other sections are skipped event by event, without building nodes or objects
+    - parsing stops once every given section found in the text has been read
+    returns {section name: section}
+    """
+    # a section whose name is nowhere in the text can not follow
+    wanted = set(section for section in sections if section in text)
+    found = dict()
+    loader = _template_loader()(text)
+    loader.anchors = dict()
+    try:
+        loader.get_event()
+        if not loader.check_event(yaml.DocumentStartEvent):
+            return found
+        loader.get_event()
+        if not loader.check_event(yaml.MappingStartEvent):
+            return found
+        loader.get_event()
+        while len(wanted) > 0 and not loader.check_event(yaml.MappingEndEvent):
+            key = loader.compose_node(None, None)
+            name = key.value if isinstance(key, yaml.ScalarNode) else None
+            if name in wanted:
+                found[name] = loader.construct_document(loader.compose_node(None, None))
+                wanted.discard(name)
+            else:
+                _skip_node(loader)
+    finally:
+        loader.dispose()
+    return found
+
+def parse_template_yaml(text:str) -> dict:
+    # only TEMPLATE_SECTIONS are read, anything parse_yaml_sections can not read is left to cfn_flip
+    try:
+        return parse_yaml_sections(text)
+    except yaml.YAMLError as ex:
+        logger.debug("fall back to cfn_flip : %s", ex)
+        return json.loads(cfn_flip.to_json(text))
+
+_template_cache = dict()
+
+class NotTemplateError(ValueError):
+    # raised for json or yaml documents which are not cfn templates, such as parameter files
+    pass
+
+def load_template_sections(template_path:str) -> dict:
+    """
+    load Parameters and Rules sections of given cfn template (yaml or json)
+    - parsed sections are cached by path and reused while the file's mtime and size,
+      or else its content hash, stay the same
+    - returned sections are shared with the cache and must not be modified
+    - raises NotTemplateError for documents which are not mappings or have neither Parameters nor Resources
+    """
+    with tracer.span("load template", "template", path=template_path) as span:
+        path = os.path.abspath(template_path)
+        stat = os.stat(path)
+        cached = _template_cache.get(path)
+        if cached is not None and (cached["mtime"], cached["size"]) == (stat.st_mtime_ns, stat.st_size):
+            span["cache"] = "hit"
+            return cached["sections"]
+
+        with open(path, "rb") as fp:
+            body = fp.read()
+        digest = hashlib.sha256(body).hexdigest()
+        if cached is not None and cached["digest"] == digest:
+            cached.update(mtime=stat.st_mtime_ns, size=stat.st_size)
+            span["cache"] = "hash hit"
+            return cached["sections"]
+
+        text = body.decode("utf-8")
+        if path.split(".")[-1] != "json":
+            with tracer.span("parse template", "template", size=len(body)):
+                template = parse_template_yaml(text)
+            # only TEMPLATE_SECTIONS are read, so Resources is looked for in the text
+            has_resources = isinstance(template, dict) and ("Resources" in template or re.search(r"^Resources\s*:", text, re.M) is not None)
+        else:
+            template = json.loads(text)
+            has_resources = isinstance(template, dict) and "Resources" in template
+        if not isinstance(template, dict) or ("Parameters" not in template and not has_resources):
+            raise NotTemplateError(f"{template_path} is not a cfn template")
+        sections = dict(Parameters=template.get("Parameters") or {}, Rules=template.get("Rules") or {})
+        span.update(cache="miss", parameters=len(sections["Parameters"]))
+        _template_cache[path] = dict(
+            mtime=stat.st_mtime_ns, size=stat.st_size, digest=digest, sections=sections,
         )
-        aws_type = self.type[len("AWS::SSM::Parameter::Value<"):-1]
-        allowed_values = AwsExtension.parameter_widgets[aws_type](self.name, self.param_def).allowed_values
-        allowed_values = [val.split(" | ")[0].split("(")[0] for val in allowed_values]
-        return [
-            f"{param['Name']} | {param['Value']}" for param in response["Parameters"]
-            if set(param["Value"].split(",")) < set(allowed_values)
-        ]
-    def get_value(self):
-        return self.widget.value.split(" | ")[0]
+        return sections
 
+def load_parameter_definitions(template_path:str) -> dict:
+    # Parameters section of given cfn template, see load_template_sections
+    return load_template_sections(template_path)["Parameters"]
 
-class AwsSsmListSpecificParameters(StringParameter):
-    def __init__(self, param_name: str, param_def: dict) -> None:
-        self.client = boto3.client("ssm")
-        self.param_def = param_def
-        self.type = param_def["Type"]
-        self.name = param_name
-        param_def["AllowedValues"] = self._get_allowed_value_from_aws()
 
-        super().__init__(param_name, param_def)
+class ParameterForm:
+    """
+    widgets and the save button for parameters of one template
+    - widgets of parameters unchanged since the last load keep their values
+    """
 
-    def _get_allowed_value_from_aws(self):
-        response = self.client.describe_parameters(Filters=[
-            {"Key" : "Type", "Values": ["String"]}
-        ])
-        response = self.client.get_parameters(
-            Names=[param["Name"] for param in response["Parameters"]],
+    def __init__(self, template_path:str, parameter_path:str=None) -> None:
+        self.template_path = template_path
+        self.parameter_path = parameter_path
+        self.parameter_vals = dict()
+        self.parameter_defs = dict()
+        self._status_timer = None
+        # aws region and profile allowed values are listed from, None for the defaults
+        self.region = None
+        self.profile = None
+        # {parameter name: vpc parameter name} of parameters listed within the chosen vpc
+        self.vpc_dependencies = dict()
+        self._vpc_parameters = weakref.WeakSet()
+        self._retargeting = False
+        self._prefilling = False
+        self._loading_tasks = []
+        # values last saved or prefilled, where they come from, and the parameter file's (mtime, size) then
+        self.baseline = dict()
+        self.baseline_source = None
+        self._baseline_stat = None
+
+        self.common_style = {'description_width': '250px'}
+        self.common_layout = {"width": "auto"}
+
+    def load(self, prefill:dict=None, prefill_source:str=None) -> dict:
+        """
+        load parameter definitions of the template and build widgets for new or changed ones
+        - widgets whose lookups are still running or have failed are loaded again
+        - new widgets select values saved in the parameter file, if it exists, instead of defaults
+        - every widget selects values given by prefill (e.g. from a deployed stack) instead
+        returns definitions of parameters whose widgets have been built or have to be loaded again
+        """
+        # load parameters and rules sections of cfn template
+        sections = load_template_sections(self.template_path)
+        parameter_defs = sections["Parameters"]
+        logger.debug("loaded parameter definitions : %s", parameter_defs)
+
+        # initialize widgets only for new or changed parameters, aws-backed ones are shown as loading.
+        # widgets of untouched parameters keep their values and skip aws lookups
+        parameter_vals = dict()
+        created = dict()
+        reloaded = 0
+        with tracer.span("build widgets", "widget", template=self.template_path) as span:
+            for param_name, param_def in parameter_defs.items():
+                p = self.parameter_vals.get(param_name)
+                if p is None or self.parameter_defs.get(param_name) != param_def:
+                    p = AwsExtension.parameter_widgets[param_def["Type"]](param_name, copy.deepcopy(param_def))
+                    p.region, p.profile = self.region, self.profile
+                    created[param_name] = param_def
+                elif p.loading or p.load_error is not None:
+                    # lookups still running or failed are made again, with the widget kept
+                    p.set_loading(True)
+                    created[param_name] = param_def
+                    reloaded += 1
+                else:
+                    # unfreeze widgets frozen by a previous save
+                    p.update_state(False)
+                parameter_vals[param_name] = p
+            span.update(built=len(created) - reloaded, reloaded=reloaded, reused=len(parameter_vals) - len(created))
+        if logger.isEnabledFor(DEBUG):
+            logger.debug("rebuilt parameters : %s", list(created))
+            logger.debug("removed parameters : %s", [name for name in self.parameter_vals if name not in parameter_vals])
+        self.parameter_vals = parameter_vals
+        self.parameter_defs = dict(parameter_defs)
+        self._prefill(created, prefill, prefill_source)
+        self._link_vpc_parameters(find_vpc_dependencies(parameter_defs, sections["Rules"]), created)
+        return created
+
+    def _prefill(self, created:dict, prefill:dict=None, prefill_source:str=None):
+        # vpc parameters selected here are followed by their dependents in _link_vpc_parameters at once
+        saved = dict()
+        if self.parameter_path is not None:
+            try:
+                saved = load_parameters_file(self.parameter_path)
+            except (OSError, ValueError, KeyError, AttributeError) as ex:
+                logger.warning("failed to load saved parameters from %s : %s", self.parameter_path, ex)
+        values = [(name, saved[name]) for name in created if name in saved]
+        if prefill is not None:
+            values.extend((name, text) for name, text in prefill.items() if name in self.parameter_vals)
+        self._prefilling = True
+        try:
+            for name, text in values:
+                if not self.parameter_vals[name].prefill(text):
+                    logger.warning("failed to prefill %s with %s", name, "****" if self.parameter_vals[name].no_echo else text)
+        finally:
+            self._prefilling = False
+        if prefill is not None:
+            self._set_baseline(prefill, prefill_source)
+        elif self.baseline_source != self.parameter_path or self._baseline_stat != self._parameter_file_stat():
+            self._set_baseline(saved, self.parameter_path)
+        logger.debug("prefilled parameters : %s", [name for name, _ in values])
+
+    def _parameter_file_stat(self) -> tuple:
+        try:
+            stat = os.stat(self.parameter_path)
+        except (OSError, TypeError):
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def _set_baseline(self, values:dict, source:str):
+        self.baseline = {name: parameter_text(value) for name, value in values.items()}
+        self.baseline_source = source
+        self._baseline_stat = self._parameter_file_stat() if source == self.parameter_path else None
+
+    def diff(self) -> dict:
+        # parameters whose current values differ from the baseline, see diff_parameters
+        return diff_parameters(self.baseline, self._parameters_file_body()["Parameters"])
+
+    def _link_vpc_parameters(self, vpc_dependencies:dict, created:dict):
+        # new widgets get the vpc chosen at the moment and are loaded with the others,
+        # reused widgets are loaded again here if their vpc has changed
+        self.vpc_dependencies = vpc_dependencies
+        for param_name, p in self.parameter_vals.items():
+            if not p.aws_options:
+                continue
+            vpc_parameter = vpc_dependencies.get(param_name)
+            vpc_id = None if vpc_parameter is None else self.parameter_vals[vpc_parameter].widget.value or None
+            if param_name in created:
+                p.vpc_parameter, p.vpc_id = vpc_parameter, vpc_id
+            elif (p.vpc_parameter, p.vpc_id) != (vpc_parameter, vpc_id):
+                p.vpc_parameter = vpc_parameter
+                self._switch_vpc(p, vpc_id)
+        for vpc_parameter in set(vpc_dependencies.values()):
+            p = self.parameter_vals[vpc_parameter]
+            if p not in self._vpc_parameters:
+                p.observe_selection(partial(self._on_vpc_change, vpc_parameter))
+                self._vpc_parameters.add(p)
+        if logger.isEnabledFor(DEBUG):
+            logger.debug("vpc dependencies : %s", vpc_dependencies)
+
+    def _on_vpc_change(self, vpc_parameter:str, vpc_id:str):
+        if self._prefilling:
+            return
+        for param_name, dependency in self.vpc_dependencies.items():
+            p = self.parameter_vals.get(param_name)
+            if p is not None and dependency == vpc_parameter and p.vpc_id != (vpc_id or None):
+                self._switch_vpc(p, vpc_id)
+
+    def _switch_vpc(self, p:BaseAwsParameter, vpc_id:str):
+        # only listings within the chosen vpc are made, filtered on vpc-id
+        p.set_vpc(vpc_id)
+        if self._retargeting:
+            # listed again together with every other widget
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            try:
+                p.load_allowed_values_from_aws()
+            except Exception as ex:
+                p.fail_loading(ex)
+                return
+            p.set_loading(False)
+            return
+        self._loading_tasks = [task for task in self._loading_tasks if not task.done()]
+        self._loading_tasks.append(loop.create_task(p.load_allowed_values_from_aws_async(get_executor())))
+
+    def aws_parameters(self, names:list) -> list:
+        return [self.parameter_vals[name] for name in names if self.parameter_vals[name].aws_options]
+
+    def plan_prefetch(self, parameter_defs:dict=None) -> set:
+        # inventory resource types to prefetch for given parameters, all of them if None
+        return plan_inventory_prefetch(
+            self.parameter_defs if parameter_defs is None else parameter_defs, self.vpc_dependencies,
         )
-        aws_type = self.type[len("AWS::SSM::Parameter::Value<"):-1]
-        allowed_values = AwsExtension.parameter_widgets[aws_type](self.name, self.param_def).allowed_values
-        allowed_values = [val.split(" | ")[0].split("(")[0] for val in allowed_values]
-        return [
-            f"{param['Name']} | {param['Value']}" for param in response["Parameters"]
-            if param["Value"] in allowed_values
-        ]
-    def get_value(self):
-        return self.widget.value.split(" | ")[0]
+
+    def set_target(self, region:str, profile:str) -> list:
+        # returns widgets whose allowed values have to be listed again
+        self.region = region
+        self.profile = profile
+        params = self.aws_parameters(list(self.parameter_vals))
+        self._retargeting = True
+        try:
+            for p in params:
+                p.set_target(region, profile)
+        finally:
+            self._retargeting = False
+        return params
+
+    def render(self) -> widgets.Widget:
+        with tracer.span("render widgets", "widget", template=self.template_path):
+            return widgets.VBox([p.container for p in self.parameter_vals.values()] + [self._save_widget()])
+
+    def _save_widget(self) -> widgets.Widget:
+        w = widgets.Button(
+            description='save',
+            disabled=False,
+            style=self.common_style,
+            layout=self.common_layout,
+            button_style='success', # 'success', 'info', 'warning', 'danger' or ''
+            tooltip='Click here if you want to save parameter values',
+            icon='check' # (FontAwesome names without the `fa-` prefix)
+        )
+        output = widgets.Output()
+
+        def on_button_click(b):
+            # values already checked while editing are not validated again
+            errors = [error for v in self.parameter_vals.values() for error in v.show_errors(show_blank=True)]
+            if len(errors) > 0:
+                self._show_save_status(output, "\n".join(f"parameter validation error! : {error}" for error in errors), error=True)
+                return
+
+            # if all validation passes, freeze parameter values and save in them in files
+            for v in self.parameter_vals.values():
+                v.update_state(True)
+            parameter_path = self.parameter_path
+            body = self._parameters_file_body()
+            changes = diff_parameters(self.baseline, body["Parameters"])
+            # nothing is written, so nothing is deployed again, while the file still holds the baseline
+            if len(changes) == 0 and self.baseline_source == parameter_path \
+                    and self._baseline_stat is not None and self._baseline_stat == self._parameter_file_stat():
+                self._show_save_status(output, f"parameters in {parameter_path} are unchanged, skip saving")
+                return
+            changed = f" (changed from {self.baseline_source} : {', '.join(changes) or 'none'})" if len(self.baseline) > 0 else ""
+
+            def on_saved(written:bool=None, error:Exception=None):
+                if error is not None:
+                    logger.error("failed to save parameters in %s : %s", parameter_path, error)
+                    self._show_save_status(output, f"failed to save parameters in {parameter_path} : {error}", error=True)
+                    return
+                if written:
+                    self._show_save_status(output, f"successfully save parameters in {parameter_path}!{changed}")
+                else:
+                    self._show_save_status(output, f"parameters in {parameter_path} are unchanged, skip saving")
+                if parameter_path == self.parameter_path:
+                    self._set_baseline(body["Parameters"], parameter_path)
+
+            # write the file off the kernel thread, the result is shown back on the event loop
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                try:
+                    on_saved(written=self._save_parameters_as_file(body, parameter_path))
+                except OSError as ex:
+                    on_saved(error=ex)
+                return
+            future = loop.run_in_executor(get_executor(), self._save_parameters_as_file, body, parameter_path)
+            future.add_done_callback(
+                lambda f: on_saved(error=f.exception()) if f.exception() is not None else on_saved(written=f.result())
+            )
+
+        w.on_click(on_button_click)
+        return widgets.VBox([w, output])
+
+    def _show_save_status(self, output:widgets.Output, message:str, error:bool=False):
+        # messages are cleared by a timer instead of sleeping on the kernel thread
+        if self._status_timer is not None:
+            self._status_timer.cancel()
+        output.clear_output()
+        with output:
+            print(message, file=sys.stderr if error else sys.stdout)
+        self._status_timer = call_later(STATUS_MESSAGE_SECONDS, output.clear_output)
+
+    def _parameters_file_body(self) -> dict:
+        parameters_file_body = dict(Parameters={})
+        for k, v in self.parameter_vals.items():
+            parameters_file_body["Parameters"][k] = v.get_value()
+        return parameters_file_body
+
+    def _save_parameters_as_file(self, parameters_file_body:dict=None, parameter_path:str=None) -> bool:
+        if parameters_file_body is None:
+            parameters_file_body = self._parameters_file_body()
+        if parameter_path is None:
+            parameter_path = self.parameter_path
+        return save_parameters_file(parameter_path, parameters_file_body)
 
 
 @magics_class
@@ -782,123 +2658,718 @@ class AwsExtension(Magics):
     }
     
     def __init__(self, shell=None, **kwargs):
-        self.template_path = None
-        self.parameter_path = None
-
-        self.parameter_vals = dict()
-
-
-        self.common_style = {'description_width': '250px'}
-        self.common_layout = {"width": "auto"}
-
-        self.description_fmt = "{name} ({description})"
-        self.disabled = False
-
+        # forms of loaded templates keyed by their absolute paths
+        self.forms = dict()
+        self._loading_tasks = []
+        # aws region and profile every form lists allowed values from, None for the defaults
+        self.region = None
+        self.profile = None
+        self._toolbar = None
+        self._syncing_target = False
 
         super().__init__(shell, **kwargs)
 
 
     @line_magic
+    @traced
     def set_cfn_parameters(self, line):
         """
         args:
             - template_path: path to ARM template json file in which parameter definitions written
             - parameter_path: path to parameter json file for saving actual parameter values for ARM template
                 - if not specified, the default path is `{template_path's dir}/{template_path's basename}.parameters.json`
+            - --stack stack_name: prefill widgets with parameter values of the deployed stack
         - load parameters definitions from ARM template file
         - display widgets for setting each parameter values and save button
+            - values saved in the parameter file last time are selected instead of defaults
         - when save button pushed, validate parameter values and save them as parameter file
+            - the file is left untouched if no value has changed
         """
 
         line = line.split()
+        stack_name = None
+        if "--stack" in line:
+            i = line.index("--stack")
+            stack_name = line[i + 1] if i + 1 < len(line) else None
+            del line[i:i + 2]
+            if stack_name is None or len(line) == 0:
+                print("usage: %set_cfn_parameters template_path [parameter_path] [--stack stack_name]", file=sys.stderr)
+                return
         template_path = line[0]
         try:
             parameter_path = line[1]
         except IndexError:
             parameter_path = None
 
-        logger.debug(f"template_path: {template_path}")
-        logger.debug(f"parameter_path: {parameter_path}")
-        self.template_path = template_path
-        self.parameter_path = parameter_path
-
-        if self.parameter_path is None:
-            self.parameter_path = self.template_path.rsplit(
-                ".", maxsplit=1
-            )[0] + ".parameters.json"
-
-        # load ARM template and parameters section in it
-        with open(template_path, "r", encoding="utf-8") as fp:
-            if template_path.split(".")[-1] != "json":
-                template = to_json(fp.read())
-            template = json.loads(template)
-        parameter_defs = template["Parameters"]
-        logger.debug(f"loaded parameter definitions : {parameter_defs}")
-
-        # initialize widgets for each parameters
-        for param_name, param_def in parameter_defs.items():
-            p = self.parameter_widgets[param_def["Type"]](param_name, param_def)
-            self.parameter_vals[param_name] = p
-            # print(p)
-            display(p.widget)
-
-        display(self._save_widget())
+        logger.debug("template_path: %s", template_path)
+        logger.debug("parameter_path: %s", parameter_path)
+        # the stack is described while the template is being loaded
+        stack = None
+        if stack_name is not None:
+            stack = get_executor().submit(load_stack_parameters, stack_name, self.region, self.profile)
+        form = self._get_form(template_path, parameter_path)
+        prefill = None
+        if stack is not None:
+            load_template_sections(template_path)
+            try:
+                prefill = stack.result()
+            except Exception as ex:
+                print(f"failed to load parameters of stack {stack_name} : {ex}", file=sys.stderr)
+                return
+        created = form.load(prefill, None if stack_name is None else f"stack {stack_name}")
+        display(widgets.VBox([self._get_toolbar(), form.render()]))
 
-   
+        self._load_allowed_values(form.aws_parameters(created), form.plan_prefetch(created))
 
+    @line_magic
+    @traced
+    def set_cfn_templates(self, line):
+        """
+        args:
+            - templates: directory of cfn templates, or glob pattern of them
+        - display widgets of each template in its own tab, with a save button per template
+        - aws resources needed by any of templates are listed once and shared by all of them
+        - each template's parameters are saved in `{template_path's dir}/{template_path's basename}.parameters.json`
+        """
+        template_paths = find_templates(line.strip())
+        logger.debug("template_paths: %s", template_paths)
+
+        # other json and yaml files are skipped, and a template failing to load does not stop the others
+        forms = []
+        params = []
+        resource_types = set()
+        for template_path in template_paths:
+            form = self._get_form(template_path)
+            try:
+                created = form.load()
+            except Exception as ex:
+                if len(form.parameter_vals) == 0:
+                    self.forms.pop(os.path.abspath(template_path), None)
+                if isinstance(ex, NotTemplateError):
+                    logger.debug("skip %s : %s", template_path, ex)
+                else:
+                    logger.error("failed to load %s : %s", template_path, ex)
+                    print(f"failed to load {template_path} : {ex}", file=sys.stderr)
+                continue
+            forms.append(form)
+            params.extend(form.aws_parameters(created))
+            resource_types |= form.plan_prefetch(created)
+        if len(forms) == 0:
+            print(f"no cfn template found in {line.strip()}", file=sys.stderr)
+            return
+
+        tab = widgets.Tab(children=[form.render() for form in forms])
+        for i, form in enumerate(forms):
+            tab.set_title(i, os.path.basename(form.template_path))
+        display(widgets.VBox([self._get_toolbar(), tab]))
+
+        # lookups of all templates are merged, so each listing is made once
+        self._load_allowed_values(params, resource_types)
 
-    def _save_widget(self) -> widgets.Widget:
-        w = widgets.Button(
-            value=self.disabled,
-            description='save',
-            disabled=False,
-            style=self.common_style,
-            layout=self.common_layout,
-            button_style='success', # 'success', 'info', 'warning', 'danger' or ''
-            tooltip='Click here if you want to save parameter values',
-            icon='check' # (FontAwesome names without the `fa-` prefix)
+    @line_magic
+    def cfn_profile(self, line):
+        """
+        args:
+            - format: `table` (default), `waterfall` or `json`
+            - path: with `json`, file to export the profile in, printed if not specified
+        - show timed spans of the last `%set_cfn_parameters` or `%set_cfn_templates` run,
+          including aws calls and listings still running in the background
+        """
+        args = line.split()
+        fmt = args[0] if len(args) > 0 else "table"
+        profile = tracer.export()
+        if profile["run"] is None:
+            print("no run has been profiled yet", file=sys.stderr)
+            return
+        if fmt == "json":
+            body = json.dumps(profile, indent=4, default=str)
+            if len(args) > 1:
+                write_file_if_changed(args[1], body)
+                print(f"exported {len(profile['spans'])} spans in {args[1]}")
+            else:
+                print(body)
+        elif fmt == "waterfall":
+            display(HTML(format_profile_waterfall(profile)))
+        elif fmt == "table":
+            display(HTML(format_profile_table(profile)))
+        else:
+            print(f"unknown format : {fmt}, use one of table, waterfall or json", file=sys.stderr)
+
+    def _get_form(self, template_path:str, parameter_path:str=None) -> ParameterForm:
+        # widgets are reused when a template is loaded again
+        key = os.path.abspath(template_path)
+        form = self.forms.get(key)
+        if form is None:
+            form = self.forms[key] = ParameterForm(template_path)
+            form.region, form.profile = self.region, self.profile
+        form.template_path = template_path
+        form.parameter_path = default_parameter_path(template_path) if parameter_path is None else parameter_path
+        return form
+
+    def _load_allowed_values(self, params:list, resource_types:set):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+
+        if loop is None:
+            # no kernel event loop (e.g. plain python), so load them in place
+            inventory.prefetch(resource_types, regions=[self.region], profile=self.profile)
+            for p in params:
+                try:
+                    p.load_allowed_values_from_aws()
+                except Exception as ex:
+                    p.fail_loading(ex)
+                    continue
+                p.set_loading(False)
+            revalidated = inventory.revalidate()
+            for p in self._params_using(params, revalidated):
+                p.set_allowed_values(p.list_allowed_values_from_aws())
+            return
+
+        # distinct listings are submitted first so that each of them gets a worker
+        # before widget loaders start waiting on them
+        executor = get_executor()
+        inventory.prefetch(resource_types, executor=executor, regions=[self.region], profile=self.profile)
+        # keep references to tasks still running from previous calls
+        self._loading_tasks = [task for task in self._loading_tasks if not task.done()]
+        loading_tasks = [
+            loop.create_task(p.load_allowed_values_from_aws_async(executor))
+            for p in params
+        ]
+        loading_tasks.append(
+            loop.create_task(self._revalidate_async(params, list(loading_tasks), executor))
         )
+        self._loading_tasks.extend(loading_tasks)
+
+    def _get_toolbar(self) -> widgets.Widget:
+        # a single toolbar is shared by every displayed form, so all of its views stay in sync
+        if self._toolbar is not None:
+            return self._toolbar
+        style = {"description_width": "initial"}
+        profile = widgets.Dropdown(
+            description="aws profile",
+            options=[("(default)", "")] + [(name, name) for name in client_pool.available_profiles()],
+            value=self.profile or "",
+            style=style,
+        )
+        current = self.region or client_pool.default_region(self.profile)
+        regions = client_pool.available_regions(self.profile)
+        region = widgets.Dropdown(
+            description="region",
+            options=regions if current is None or current in regions else [current] + regions,
+            value=current,
+            style=style,
+        )
+        def on_change(change):
+            if not self._syncing_target:
+                self.set_target(region.value, profile.value or None)
+        profile.observe(on_change, names="value")
+        region.observe(on_change, names="value")
+
+        refresh = widgets.Button(
+            description="refresh stale", icon="refresh",
+            tooltip="list aws resources listed more than the ttl ago again",
+        )
+        status = widgets.HTML()
+        def on_refresh(b):
+            count = self.refresh_stale()
+            status.value = f"<i>refreshing {count} stale listings</i>" if count > 0 else "<i>no stale listing</i>"
+            call_later(STATUS_MESSAGE_SECONDS, lambda: setattr(status, "value", ""))
+        refresh.on_click(on_refresh)
 
-        def on_button_click(b):
-            output = widgets.Output()
-            display(output)
+        self._toolbar = widgets.HBox([profile, region, refresh, status])
+        return self._toolbar
 
+    def set_target(self, region:str, profile:str=None):
+        """
+        switch every form to list allowed values from another region or profile
+        - listings prefetched with `%prefetch_cfn_regions` are served from the cache
+        """
+        if (region, profile) == (self.region, self.profile):
+            return
+        logger.info("switch target to region %s, profile %s", region, profile)
+        self.region = region
+        self.profile = profile
+        if self._toolbar is not None:
+            # show targets switched without the selector, not to switch them again
+            self._syncing_target = True
             try:
-                for v in self.parameter_vals.values():
-                    v.validate()
-            except AssertionError as ex:
-                with output:
-                    print(f"parameter validation error! : {ex}", file=sys.stderr)
-                    sleep(5)
-                    output.clear_output()
-                return
+                profile_dropdown, region_dropdown = self._toolbar.children[:2]
+                profile_dropdown.value = profile or ""
+                if region is not None and region not in region_dropdown.options:
+                    region_dropdown.options = (region, ) + tuple(region_dropdown.options)
+                region_dropdown.value = region
+            finally:
+                self._syncing_target = False
+        params = []
+        resource_types = set()
+        for form in self.forms.values():
+            params.extend(form.set_target(region, profile))
+            resource_types |= form.plan_prefetch()
+        self._load_allowed_values(params, resource_types)
+
+    def refresh_stale(self) -> int:
+        """
+        list again every stale listing used by loaded forms, then patch widgets using them
+        - each listing is made once however many widgets use it
+        - widgets still loading are left to their loaders
+        returns the number of listings made again
+        """
+        stale = dict()
+        for form in self.forms.values():
+            for p in form.aws_parameters(list(form.parameter_vals)):
+                if p.loading:
+                    continue
+                resource_types = p.stale_resources()
+                if len(resource_types) > 0:
+                    stale[p] = resource_types
+        listings = set(
+            (resource_type, p.region, p.profile, p.vpc_scope(resource_type))
+            for p, resource_types in stale.items() for resource_type in resource_types
+        )
+        if len(listings) == 0:
+            return 0
+        logger.debug("refresh stale listings : %s", listings)
+
+        def refresh_listing(listing:tuple):
+            resource_type, region, profile, vpc_id = listing
+            client = client_pool.get_client(inventory.services[resource_type], region, profile)
+            inventory.get_entry(resource_type, client, refresh=True, vpc_id=vpc_id)
+
+        def refresh_listings():
+            with ThreadPoolExecutor(max_workers=min(PREFETCH_MAX_WORKERS, len(listings))) as executor:
+                for listing, future in [(listing, executor.submit(refresh_listing, listing)) for listing in listings]:
+                    try:
+                        future.result()
+                    except Exception as ex:
+                        logger.warning("failed to refresh %s : %s", listing, ex)
 
-            # if all validation passes, freeze parameter values and save in them in files
-            for v in self.parameter_vals.values():
-                v.update_state(True)
-            self._save_parameters_as_file()
-            with output:
-                print(f"successfully save parameters in {self.parameter_path}!")
-                sleep(5)
-                output.clear_output()
+        # listings are made already, so widgets only resolve their values again
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            refresh_listings()
+            for p in stale:
+                p.refresh(resource_types=set())
+            return len(listings)
+        future = loop.run_in_executor(get_executor(), refresh_listings)
+        future.add_done_callback(lambda f: [p.refresh(resource_types=set()) for p in stale])
+        return len(listings)
+
+    def _params_using(self, params:list, resource_types:set) -> list:
+        return [p for p in params if get_parameter_type_resources(p.type) & resource_types]
+
+    async def _revalidate_async(self, params:list, loading_tasks:list, executor:ThreadPoolExecutor):
+        # widgets are first filled from the disk cache, then refreshed with listings made again
+        await asyncio.gather(*loading_tasks, return_exceptions=True)
+        loop = asyncio.get_running_loop()
+        revalidated = await loop.run_in_executor(executor, inventory.revalidate)
+        await asyncio.gather(*[
+            p.reload_allowed_values_from_aws_async(executor)
+            for p in self._params_using(params, revalidated)
+        ])
 
+   
 
-        w.on_click(on_button_click)
-        return w
 
-    def _save_parameters_as_file(self):
+    @line_magic
+    @traced
+    def prefetch_cfn_regions(self, line):
+        """
+        args:
+            - regions: comma separated aws regions
+            - profile: aws profile to list resources with, the default profile if not specified
+        - list aws resources needed by every loaded template in all of given regions concurrently
+        - switching the region of forms afterwards fills widgets from the cache instead of calling aws
+        """
+        args = line.split()
+        if len(args) == 0:
+            print("usage: %prefetch_cfn_regions region[,region...] [profile]", file=sys.stderr)
+            return
+        regions = [region for region in args[0].split(",") if region]
+        profile = args[1] if len(args) > 1 else None
+        resource_types = set()
+        for form in self.forms.values():
+            resource_types |= form.plan_prefetch()
+        if len(resource_types) == 0:
+            print("no aws resource to prefetch, load templates with `%set_cfn_parameters` first", file=sys.stderr)
+            return
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            inventory.prefetch(resource_types, regions=regions, profile=profile)
+            print(f"prefetched {len(resource_types)} resource types in {', '.join(regions)}")
+            return
+        # listings run in the background, widgets waiting on them share the same listing
+        futures = inventory.prefetch(resource_types, executor=get_executor(), regions=regions, profile=profile)
+        print(f"prefetching {len(futures)} listings of {len(resource_types)} resource types in {', '.join(regions)}")
 
+    @line_magic
+    def purge_cfn_cache(self, line):
+        """
+        - drop every cached aws resource listing, both in memory and on disk
+        - following `%set_cfn_parameters` calls list resources from aws again
+        """
+        initialize()
+        invalidated = inventory.invalidate()
+        name_tags.clear()
+        removed = 0
+        if inventory.disk_cache is not None:
+            removed = inventory.disk_cache.purge()
+        logger.info("purged inventory cache : %s in memory, %s on disk", invalidated, removed)
+        print(f"purged {invalidated} cached inventories in memory and {removed} files in {CACHE_BASE_DIR}")
 
-        parameters_file_body = dict(Parameters={})
-        for k, v in self.parameter_vals.items():
-            parameters_file_body["Parameters"][k] = v.get_value()
-        
-        with open(self.parameter_path, "w", encoding="utf-8") as fp:
-            json.dump(parameters_file_body, fp, indent=4)
+    @line_magic
+    def cfn_log_level(self, line):
+        """
+        args:
+            - level: `DEBUG`, `INFO`, `WARNING` or `ERROR`, shows the current level if not specified
+        - records below the level are neither formatted nor written in the log file
+        """
+        initialize()
+        level = line.strip()
+        if level == "":
+            print(f"log level : {logging.getLevelName(logger.level)} ({LOG_BASE_DIR})")
+            return
+        try:
+            print(f"log level : {set_log_level(level)}")
+        except ValueError as ex:
+            print(f"invalid log level : {ex}", file=sys.stderr)
+
+
+# colors of spans in profile waterfalls by category
+PROFILE_COLORS = {
+    "magic": "#9e9e9e", "template": "#8d6e63", "widget": "#42a5f5",
+    "client": "#ab47bc", "inventory": "#66bb6a", "aws": "#ffa726",
+}
+
+def summarize_profile(profile:dict) -> str:
+    spans = profile["spans"]
+    if len(spans) == 0:
+        return f"{html.escape(profile['run'])} : no span"
+    elapsed = max(span["start"] + span["duration"] for span in spans) - min(span["start"] for span in spans)
+    aws_calls = [span for span in spans if span["category"] == "aws"]
+    return (
+        f"{html.escape(profile['run'])} : {elapsed * 1000:.1f} ms in total, "
+        f"{len(aws_calls)} aws calls taking {sum(span['duration'] for span in aws_calls) * 1000:.1f} ms"
+    )
+
+def format_profile_table(profile:dict) -> str:
+    rows = "".join(
+        "<tr>"
+        f"<td>{span['start'] * 1000:.1f}</td><td>{span['duration'] * 1000:.1f}</td>"
+        f"<td>{span['category']}</td><td>{html.escape(span['name'])}</td><td>{html.escape(span['thread'])}</td>"
+        f"<td>{html.escape(', '.join(f'{k}={v}' for k, v in span['attributes'].items()))}</td>"
+        "</tr>"
+        for span in profile["spans"]
+    )
+    return (
+        f"<p>{summarize_profile(profile)}</p><table>"
+        "<tr><th>start (ms)</th><th>duration (ms)</th><th>category</th><th>name</th><th>thread</th><th>attributes</th></tr>"
+        f"{rows}</table>"
+    )
+
+def format_profile_waterfall(profile:dict) -> str:
+    spans = profile["spans"]
+    origin = min((span["start"] for span in spans), default=0)
+    elapsed = max((span["start"] + span["duration"] - origin for span in spans), default=0) or 1
+    rows = "".join(
+        "<div style='display:flex;align-items:center;font-size:12px'>"
+        f"<div style='width:300px;overflow:hidden;white-space:nowrap'>{html.escape(span['name'])}</div>"
+        "<div style='flex:1;position:relative;height:14px'>"
+        f"<div title='{span['duration'] * 1000:.1f} ms' style='position:absolute;height:100%;"
+        f"left:{(span['start'] - origin) / elapsed * 100:.2f}%;width:max(1px,{span['duration'] / elapsed * 100:.2f}%);"
+        f"background:{PROFILE_COLORS.get(span['category'], '#bdbdbd')}'></div></div>"
+        f"<div style='width:80px;text-align:right'>{span['duration'] * 1000:.1f} ms</div>"
+        "</div>"
+        for span in spans
+    )
+    return f"<p>{summarize_profile(profile)}</p>{rows}"
+
+
+# file suffixes taken as cfn templates when a directory is given
+TEMPLATE_SUFFIXES = (".yaml", ".yml", ".json", ".template")
+
+def find_templates(path:str) -> list:
+    """
+    list cfn templates in a directory, or those matching a glob pattern
+    - parameter files are never taken as templates
+    """
+    if os.path.isdir(path):
+        paths = [
+            os.path.join(path, name) for name in os.listdir(path)
+            if name.endswith(TEMPLATE_SUFFIXES)
+        ]
+    else:
+        paths = glob.glob(path)
+    return sorted(p for p in paths if os.path.isfile(p) and not p.endswith(".parameters.json"))
 
 
+class ParameterValidationError(AssertionError):
+    def __init__(self, template_path:str, errors:list) -> None:
+        super().__init__(template_path, errors)
+        self.template_path = template_path
+        self.errors = errors
+
+    def __str__(self) -> str:
+        return f"{len(self.errors)} invalid parameters in {self.template_path} : " + "; ".join(self.errors)
+
+
+def default_parameter_path(template_path:str) -> str:
+    return template_path.rsplit(".", maxsplit=1)[0] + ".parameters.json"
+
+def save_parameters_file(parameter_path:str, parameters_file_body:dict) -> bool:
+    return write_file_if_changed(parameter_path, json.dumps(parameters_file_body, indent=4))
+
+def parameter_text(value) -> str:
+    # a parameter value as written in parameter files, lists are joined with commas
+    if value is None:
+        return ""
+    if isinstance(value, list):
+        return ",".join(map(str, value))
+    return str(value)
+
+def load_parameters_file(parameter_path:str) -> dict:
+    """
+    load parameter values from a parameter file, {} if it does not exist
+    - `{"Parameters": {name: value}}` as saved by this extension, and
+      `[{"ParameterKey": name, "ParameterValue": value}]` as taken by aws cli are accepted
+    returns {parameter name: value as text}
+    """
+    try:
+        with open(parameter_path, encoding="utf-8") as fp:
+            body = json.load(fp)
+    except FileNotFoundError:
+        return dict()
+    return parse_parameters_body(body)
+
+def parse_parameters_body(body) -> dict:
+    # {parameter name: value as text} of either format load_parameters_file accepts
+    if isinstance(body, list):
+        return {param["ParameterKey"]: parameter_text(param.get("ParameterValue")) for param in body}
+    return {name: parameter_text(value) for name, value in body.get("Parameters", {}).items()}
+
+def load_stack_parameters(stack_name:str, region:str=None, profile:str=None) -> dict:
+    """
+    load parameter values of a deployed stack with describe_stacks
+    - values of NoEcho parameters are masked by aws, so they are left out
+    returns {parameter name: value as text}
+    """
+    client = client_pool.get_client("cloudformation", region, profile)
+    with tracer.span("describe stack", "aws", stack=stack_name):
+        for stacks in _paginate(client, "describe_stacks", "Stacks", StackName=stack_name):
+            for stack in stacks:
+                return {
+                    param["ParameterKey"]: param["ParameterValue"] for param in stack.get("Parameters", [])
+                    if param.get("ParameterValue") != "****"
+                }
+    return dict()
+
+def diff_parameters(old:dict, new:dict) -> dict:
+    """
+    compare two sets of parameter values as written in parameter files
+    returns {parameter name: (old text, new text)} of added, removed or changed parameters, None if missing
+    """
+    changes = dict()
+    for name in list(new) + [name for name in old if name not in new]:
+        old_text = None if name not in old else parameter_text(old[name])
+        new_text = None if name not in new else parameter_text(new[name])
+        if old_text != new_text:
+            changes[name] = (old_text, new_text)
+    return changes
+
+def check_parameter_value(parameter:BaseAwsParameter, text:str, region:str=None, profile:str=None, vpc_id:str=None) -> list:
+    """
+    return every error message for a value given as in parameter files, without widgets
+    - the same checks as widgets do, plus that the value is one of allowed values
+    - aws-specific values are looked up with the resolver, searched on aws by their ids where possible
+    - ssm parameter names are looked up by name, then their values are checked for the inner type
+    - with vpc_id, subnets and security groups must be in that vpc
+    """
+    name = parameter.name
+    try:
+        value = parameter.parse_value(text)
+    except ValueError:
+        return [f"{name} must be a number"]
+    errors = parameter.check(value)
+    if len(errors) > 0:
+        return errors
+
+    values = value if isinstance(value, tuple) else (value, )
+    if parameter.type.startswith(AllowedValuesResolver.ssm_value_prefix):
+        problems = allowed_values_resolver.check_ssm_parameters(parameter.type, values, region, profile)
+        errors.extend(f"{name} : {v} {problems[v]}" for v in values if v in problems)
+    elif parameter.aws_options and allowed_values_resolver.resolvable(parameter.type):
+        if allowed_values_resolver.searchable(parameter.type):
+            def allowed(v):
+                return any(v == found for found, _ in allowed_values_resolver.search(parameter.type, v, region=region, profile=profile))
+        else:
+            allowed_ids = set(v for v, _ in allowed_values_resolver.resolve(parameter.type, region, profile, vpc_id)) | set(parameter.allowed_values)
+            def allowed(v):
+                return v in allowed_ids
+        errors.extend(f"{name} : {v} is not found in aws" for v in values if not allowed(v))
+    elif len(parameter.allowed_values) > 0:
+        # numbers are compared as numbers, anything else as strings
+        normalize = float if isinstance(value, float) else str
+        allowed_values = set(normalize(v) for v in parameter.allowed_values)
+        errors.extend(f"{name} : {v} is not one of allowed values" for v in values if normalize(v) not in allowed_values)
+    return errors
+
+def generate_parameters(template_path:str, parameter_path:str=None, overrides:dict=None, region:str=None, profile:str=None) -> dict:
+    """
+    resolve and validate parameter values of a template without widgets, then save them as parameter file
+    - values are taken from overrides, or from Default of each parameter
+    - every parameter is validated and all errors are raised at once as ParameterValidationError
+    - subnets and security groups scoped by a vpc parameter are looked up within the vpc given to it
+    - the file is written the same as the save button does, and left untouched if unchanged
+    returns the parameters file body
+    """
+    initialize()
+    if parameter_path is None:
+        parameter_path = default_parameter_path(template_path)
+    overrides = dict() if overrides is None else overrides
+
+    sections = load_template_sections(template_path)
+    parameter_defs = sections["Parameters"]
+    vpc_dependencies = find_vpc_dependencies(parameter_defs, sections["Rules"])
+    inventory.prefetch(plan_inventory_prefetch(parameter_defs, vpc_dependencies), regions=[region], profile=profile)
+
+    texts = dict()
+    for param_name, param_def in parameter_defs.items():
+        text = overrides.get(param_name, param_def.get("Default", None))
+        texts[param_name] = "" if text is None else ",".join(map(str, text)) if isinstance(text, list) else str(text)
+
+    parameters_file_body = dict(Parameters={})
+    errors = []
+    for param_name, param_def in parameter_defs.items():
+        parameter = AwsExtension.parameter_widgets[param_def["Type"]](param_name, copy.deepcopy(param_def), headless=True)
+        text = texts[param_name]
+        vpc_id = texts.get(vpc_dependencies.get(param_name)) or None
+        param_errors = check_parameter_value(parameter, text, region, profile, vpc_id)
+        if len(param_errors) > 0:
+            errors.extend(param_errors)
+            continue
+        parameters_file_body["Parameters"][param_name] = parameter.format_value(parameter.parse_value(text))
+    if len(errors) > 0:
+        raise ParameterValidationError(template_path, errors)
+
+    # unchanged values are not written again, even if the file is formatted differently
+    try:
+        saved = load_parameters_file(parameter_path)
+    except (OSError, ValueError, KeyError, AttributeError) as ex:
+        logger.warning("failed to load saved parameters from %s : %s", parameter_path, ex)
+        saved = dict()
+    changes = diff_parameters(saved, parameters_file_body["Parameters"])
+    written = len(changes) > 0 and save_parameters_file(parameter_path, parameters_file_body)
+    logger.info("generated parameters of %s in %s (written: %s, changed: %s)", template_path, parameter_path, written, list(changes))
+    return parameters_file_body
+
+def _generate_parameters_in_process(template_path:str, overrides:dict, region:str, profile:str) -> list:
+    # runs in worker processes, errors are returned instead of raised
+    inventory.serve_stale = False
+    try:
+        generate_parameters(template_path, overrides=overrides, region=region, profile=profile)
+    except ParameterValidationError as ex:
+        return ex.errors
+    except Exception as ex:
+        logger.error("failed to generate parameters of %s : %s", template_path, ex)
+        return [f"{type(ex).__name__} : {ex}"]
+    finally:
+        flush_log()
+    return []
+
+def generate_parameters_files(template_paths:list, overrides:dict=None, region:str=None, max_workers:int=None, profile:str=None) -> dict:
+    """
+    generate parameter files of many templates in parallel on a process pool
+    - each file is saved next to its template
+    - overrides apply to parameters of the same name in every template
+    returns errors of each template, an empty list if its file has been generated
+    """
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            template_path: executor.submit(_generate_parameters_in_process, template_path, overrides, region, profile)
+            for template_path in template_paths
+        }
+        return {template_path: future.result() for template_path, future in futures.items()}
+
+def load_overrides(overrides_path:str=None, parameters:list=None, environ:dict=None) -> dict:
+    """
+    merge parameter value overrides, later ones win
+    - a json file, either a parameter file in any format load_parameters_file accepts or a plain object of names and values
+    - environment variables prefixed with PARAMETER_ENV_PREFIX
+    - `Name=Value` strings
+    """
+    overrides = dict()
+    if overrides_path is not None:
+        with open(overrides_path, "r", encoding="utf-8") as fp:
+            body = json.load(fp)
+        if isinstance(body, dict) and "Parameters" not in body:
+            overrides.update(body)
+        else:
+            overrides.update(parse_parameters_body(body))
+    for key, value in (os.environ if environ is None else environ).items():
+        if key.startswith(PARAMETER_ENV_PREFIX):
+            overrides[key[len(PARAMETER_ENV_PREFIX):]] = value
+    for parameter in parameters or []:
+        name, sep, value = parameter.partition("=")
+        if not sep:
+            raise ValueError(f"parameter override must be a form of Name=Value : {parameter}")
+        overrides[name] = value
+    return overrides
+
+def main(argv:list=None) -> int:
+    import argparse
+    initialize()
+    # values are checked only once, so they must not be checked against expired listings
+    inventory.serve_stale = False
+    parser = argparse.ArgumentParser(
+        description="generate parameter files of cfn templates without jupyter notebook",
+    )
+    parser.add_argument("templates", nargs="+", help="paths to cfn templates")
+    parser.add_argument("-o", "--parameter-path", help="path to parameter file, only with a single template (default: {template}.parameters.json)")
+    parser.add_argument("--overrides", help="json file of parameter values")
+    parser.add_argument("-p", "--parameter", action="append", default=[], metavar="NAME=VALUE", help="parameter value, may be repeated")
+    parser.add_argument("--region", help="aws region to look up aws-specific parameter values")
+    parser.add_argument("--profile", help="aws profile to look up aws-specific parameter values")
+    parser.add_argument("--max-workers", type=int, default=None, help="number of worker processes for multiple templates")
+    parser.add_argument("--log-level", default=None, help=f"level of the log file in {LOG_BASE_DIR} (default: {LOG_LEVEL})")
+    args = parser.parse_args(argv)
+    if args.log_level is not None:
+        os.environ["AWS_CFN_NB_EXTENSIONS_LOG_LEVEL"] = args.log_level
+        try:
+            set_log_level(args.log_level)
+        except ValueError as ex:
+            parser.error(str(ex))
+
+    if args.parameter_path is not None and len(args.templates) > 1:
+        parser.error("--parameter-path can only be used with a single template")
+    try:
+        overrides = load_overrides(args.overrides, args.parameter)
+    except (OSError, ValueError) as ex:
+        parser.error(str(ex))
+
+    if len(args.templates) == 1:
+        try:
+            generate_parameters(args.templates[0], args.parameter_path, overrides, args.region, args.profile)
+            results = {args.templates[0]: []}
+        except ParameterValidationError as ex:
+            results = {args.templates[0]: ex.errors}
+    else:
+        results = generate_parameters_files(args.templates, overrides, args.region, args.max_workers, args.profile)
+
+    for template_path, errors in results.items():
+        if len(errors) == 0:
+            print(f"generated parameters of {template_path}")
+            continue
+        for error in errors:
+            print(f"{template_path} : {error}", file=sys.stderr)
+    return 1 if any(len(errors) > 0 for errors in results.values()) else 0
 
 
 def load_ipython_extension(ipython):
     ipython.register_magics(AwsExtension)
 
+
+if __name__ == "__main__":
+    sys.exit(main())
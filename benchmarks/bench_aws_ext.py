@@ -0,0 +1,331 @@
+"""
+benchmark aws_ext against a local stand-in of aws
+
+- aws api calls are answered by a botocore `before-call` handler from synthetic accounts,
+  so no credential nor network is needed
+- reports wall time, number of api calls and peak memory (tracemalloc) of
+  - `AwsExtension.set_cfn_parameters` for templates of each number of parameters
+  - listing allowed values of each aws-specific parameter class
+  for accounts of each size, both with cold and warm inventory caches
+
+usage:
+    python benchmarks/bench_aws_ext.py --sizes 10,1000,50000 --parameters 5,50,200 --json result.json
+"""
+import os
+import sys
+import json
+import time
+import fnmatch
+import argparse
+import tempfile
+import threading
+import tracemalloc
+from collections import Counter
+
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+os.environ.setdefault("AWS_ACCESS_KEY_ID", "benchmark")
+os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "benchmark")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import boto3
+import yaml
+from botocore.awsrequest import AWSResponse
+
+import aws_ext
+
+
+class AwsStandIn:
+    """
+    answers aws api calls made through a boto3 session from a synthetic account
+    - list calls are paginated with MaxResults/NextToken (MaxItems/Marker for route53)
+    - Filters and ParameterFilters used by aws_ext are supported
+    - `latency` seconds are slept per call to mimic round trips
+    """
+
+    # record keys compared by each ec2 filter name, values may contain wildcards
+    filter_keys = {
+        "state": "State", "key": "Key", "resource-id": "ResourceId", "vpc-id": "VpcId",
+        "instance-id": "InstanceId", "volume-id": "VolumeId", "subnet-id": "SubnetId",
+        "group-id": "GroupId", "group-name": "GroupName",
+    }
+
+    def __init__(self, size:int, latency:float=0.0) -> None:
+        self.latency = latency
+        self.calls = Counter()
+        self._lock = threading.Lock()
+        self.build(size)
+
+    def build(self, size:int):
+        vpc_count = max(1, size // 100)
+        self.vpcs = [
+            {"VpcId": f"vpc-{i:08x}", "Tags": [{"Key": "Name", "Value": f"vpc{i}"}]}
+            for i in range(vpc_count)
+        ]
+        self.subnets = [
+            {"SubnetId": f"subnet-{i:08x}", "VpcId": self.vpcs[i % vpc_count]["VpcId"], "Tags": [{"Key": "Name", "Value": f"subnet{i}"}]}
+            for i in range(size)
+        ]
+        self.security_groups = [
+            {"GroupId": f"sg-{i:08x}", "GroupName": f"sg{i}", "VpcId": self.vpcs[i % vpc_count]["VpcId"]}
+            for i in range(size)
+        ]
+        self.instances = [
+            {"InstanceId": f"i-{i:017x}", "VpcId": self.vpcs[i % vpc_count]["VpcId"], "Tags": [{"Key": "Name", "Value": f"instance{i}"}]}
+            for i in range(size)
+        ]
+        self.volumes = [
+            {"VolumeId": f"vol-{i:017x}", "Tags": [{"Key": "Name", "Value": f"volume{i}"}]}
+            for i in range(size)
+        ]
+        self.key_pairs = [{"KeyName": f"key{i}"} for i in range(min(size, 1000))]
+        self.availability_zones = [{"ZoneName": f"us-east-1{c}", "State": "available"} for c in "abcdef"]
+        self.hosted_zones = [
+            {"Id": f"/hostedzone/Z{i:012d}", "Name": f"zone{i}.example.com."}
+            for i in range(min(size, 500))
+        ]
+        self.ssm_parameters = [
+            {"Name": f"/benchmark/string/{i}", "Type": "String", "Value": self.vpcs[i % vpc_count]["VpcId"]}
+            for i in range(size)
+        ] + [
+            {"Name": f"/benchmark/list/{i}", "Type": "StringList", "Value": "us-east-1a,us-east-1b"}
+            for i in range(size)
+        ]
+        self._ssm_index = {param["Name"]: param for param in self.ssm_parameters}
+        self._tags = [
+            {"ResourceId": resource[id_key], "Key": tag["Key"], "Value": tag["Value"]}
+            for resources, id_key in [(self.vpcs, "VpcId"), (self.subnets, "SubnetId"), (self.instances, "InstanceId"), (self.volumes, "VolumeId")]
+            for resource in resources for tag in resource.get("Tags", [])
+        ]
+
+    def install(self, session:boto3.session.Session):
+        session.events.register("before-parameter-build.*.*", self._keep_params, unique_id="benchmark-stand-in-params")
+        session.events.register("before-call.*.*", self._handle, unique_id="benchmark-stand-in-call")
+
+    def _keep_params(self, params:dict, context:dict, **kwargs):
+        context["benchmark_params"] = dict(params)
+
+    def _page(self, items:list, params:dict, default_size:int=1000, token_key:str="NextToken", size_key:str="MaxResults"):
+        start = int(params.get(token_key) or 0)
+        size = int(params.get(size_key) or default_size)
+        response = dict()
+        if start + size < len(items):
+            response[token_key] = str(start + size)
+        return items[start:start + size], response
+
+    def _filter(self, items:list, filters:list) -> list:
+        for f in filters:
+            name, values = f["Name"], f["Values"]
+            if name.startswith("tag:"):
+                key = name[len("tag:"):]
+                items = [
+                    item for item in items
+                    if any(tag["Key"] == key and any(fnmatch.fnmatchcase(tag["Value"], v) for v in values) for tag in item.get("Tags", []))
+                ]
+            else:
+                key = self.filter_keys[name]
+                # values without wildcards, such as resource ids of describe_tags, are matched by a set lookup
+                exact = set(v for v in values if not any(c in v for c in "*?["))
+                patterns = [v for v in values if v not in exact]
+                items = [
+                    item for item in items
+                    if str(item.get(key, "")) in exact or any(fnmatch.fnmatchcase(str(item.get(key, "")), v) for v in patterns)
+                ]
+        return items
+
+    def _ssm_filter(self, items:list, filters:list) -> list:
+        for f in filters:
+            key, option, values = f["Key"], f.get("Option", "Equals"), f["Values"]
+            if key == "Name" and option == "BeginsWith":
+                items = [item for item in items if any(item["Name"].startswith(v) for v in values)]
+            else:
+                items = [item for item in items if item.get(key) in values]
+        return items
+
+    def _handle(self, model, context:dict, **kwargs):
+        params = context.get("benchmark_params", {})
+        with self._lock:
+            self.calls[f"{model.service_model.service_name}.{model.name}"] += 1
+        if self.latency > 0:
+            time.sleep(self.latency)
+
+        operation = model.name
+        filters = params.get("Filters", [])
+        if operation == "GetCallerIdentity":
+            response = {"Account": "123456789012"}
+        elif operation == "DescribeAvailabilityZones":
+            response = {"AvailabilityZones": self._filter(self.availability_zones, filters)}
+        elif operation == "DescribeKeyPairs":
+            response = {"KeyPairs": self.key_pairs}
+        elif operation == "DescribeInstances":
+            instances, response = self._page(self._filter(self.instances, filters), params)
+            response["Reservations"] = [{"Instances": instances}]
+        elif operation in ("DescribeVpcs", "DescribeSubnets", "DescribeSecurityGroups", "DescribeVolumes", "DescribeTags"):
+            result_key, items = {
+                "DescribeVpcs": ("Vpcs", self.vpcs),
+                "DescribeSubnets": ("Subnets", self.subnets),
+                "DescribeSecurityGroups": ("SecurityGroups", self.security_groups),
+                "DescribeVolumes": ("Volumes", self.volumes),
+                "DescribeTags": ("Tags", self._tags),
+            }[operation]
+            page, response = self._page(self._filter(items, filters), params)
+            response[result_key] = page
+        elif operation == "ListHostedZones":
+            page, response = self._page(self.hosted_zones, params, 100, "Marker", "MaxItems")
+            response["HostedZones"] = page
+            response["IsTruncated"] = "Marker" in response
+            if response["IsTruncated"]:
+                response["NextMarker"] = response.pop("Marker")
+            response["Marker"] = params.get("Marker", "")
+            response["MaxItems"] = str(params.get("MaxItems") or 100)
+        elif operation == "DescribeParameters":
+            items = self._ssm_filter(self.ssm_parameters, params.get("ParameterFilters", []))
+            page, response = self._page(items, params, 50)
+            response["Parameters"] = [{"Name": param["Name"], "Type": param["Type"]} for param in page]
+        elif operation == "GetParameters":
+            names = params["Names"]
+            if len(names) > 10:
+                raise ValueError("GetParameters accepts at most 10 names")
+            response = {
+                "Parameters": [self._ssm_index[name] for name in names if name in self._ssm_index],
+                "InvalidParameters": [name for name in names if name not in self._ssm_index],
+            }
+        elif operation == "DescribeStacks":
+            response = {"Stacks": [{"StackName": params.get("StackName"), "Parameters": []}]}
+        else:
+            raise NotImplementedError(f"{operation} is not supported by the stand-in")
+        response["ResponseMetadata"] = {"HTTPStatusCode": 200}
+        return AWSResponse("https://stand-in.invalid", 200, {}, None), response
+
+
+def benchmark_types() -> list:
+    return [
+        parameter_type for parameter_type in aws_ext.AwsExtension.parameter_widgets
+        if aws_ext.AwsExtension.parameter_widgets[parameter_type].aws_options
+    ]
+
+def plain_parameter(parameter_type:str) -> dict:
+    return {
+        "String": {"Type": "String", "Default": "value"},
+        "Number": {"Type": "Number", "Default": 1},
+        "CommaDelimitedList": {"Type": "CommaDelimitedList", "Default": "a,b"},
+    }[parameter_type]
+
+def write_template(path:str, parameter_count:int):
+    # aws-specific types are cycled, every fourth parameter is a plain one
+    aws_types = benchmark_types()
+    plain_types = ["String", "Number", "CommaDelimitedList"]
+    parameters = dict()
+    for i in range(parameter_count):
+        if i % 4 == 3:
+            parameters[f"Plain{i}"] = plain_parameter(plain_types[i % len(plain_types)])
+        else:
+            parameters[f"Aws{i}"] = {"Type": aws_types[i % len(aws_types)]}
+    with open(path, "w", encoding="utf-8") as fp:
+        yaml.safe_dump({"Parameters": parameters, "Resources": {"Bucket": {"Type": "AWS::S3::Bucket"}}}, fp)
+
+def reset_caches():
+    aws_ext.inventory.invalidate()
+    aws_ext.name_tags.clear()
+    with aws_ext.allowed_values_resolver._lock:
+        aws_ext.allowed_values_resolver._memo.clear()
+    aws_ext._template_cache.clear()
+
+def measure(func, stand_in:AwsStandIn, memory:bool) -> dict:
+    stand_in.calls.clear()
+    if memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    try:
+        func()
+        elapsed = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1] if memory else None
+    finally:
+        if memory:
+            tracemalloc.stop()
+    return dict(
+        wall_ms=round(elapsed * 1000, 1),
+        api_calls=sum(stand_in.calls.values()),
+        peak_kib=None if peak is None else round(peak / 1024, 1),
+        calls=dict(stand_in.calls),
+    )
+
+def bench_set_cfn_parameters(stand_in:AwsStandIn, template_path:str, memory:bool) -> list:
+    results = []
+    reset_caches()
+    extension = aws_ext.AwsExtension(shell=None)
+    for cache in ("cold", "warm"):
+        # the warm run loads the same template on a new extension, hitting cached inventories
+        if cache == "warm":
+            extension = aws_ext.AwsExtension(shell=None)
+        result = measure(lambda: extension.set_cfn_parameters(template_path), stand_in, memory)
+        results.append(dict(scenario="set_cfn_parameters", cache=cache, **result))
+    return results
+
+def bench_parameter_classes(stand_in:AwsStandIn, memory:bool) -> list:
+    results = []
+    for parameter_type in benchmark_types():
+        reset_caches()
+        parameter_class = aws_ext.AwsExtension.parameter_widgets[parameter_type]
+        def load():
+            parameter = parameter_class("Benchmark", {"Type": parameter_type})
+            parameter.load_allowed_values_from_aws()
+        result = measure(load, stand_in, memory)
+        results.append(dict(scenario=parameter_type, cache="cold", **result))
+    return results
+
+def run(sizes:list, parameter_counts:list, latency:float, memory:bool, classes:bool) -> list:
+    # display() of widgets is a no-op outside of notebooks, and the disk cache is kept out of measurements
+    aws_ext.inventory.disk_cache = None
+    session = aws_ext.client_pool.get_session()
+    results = []
+    # clients keep the handlers of the session they are created from, so one stand-in is rebuilt per size
+    stand_in = AwsStandIn(0, latency)
+    stand_in.install(session)
+    # service models are loaded by the first client of each service, which is left out of measurements
+    for service in set(aws_ext.AwsInventory.services.values()) | {"sts"}:
+        aws_ext.client_pool.get_client(service)
+    with tempfile.TemporaryDirectory() as work_dir:
+        for size in sizes:
+            stand_in.build(size)
+            for parameter_count in parameter_counts:
+                template_path = os.path.join(work_dir, f"template-{parameter_count}.yaml")
+                write_template(template_path, parameter_count)
+                for result in bench_set_cfn_parameters(stand_in, template_path, memory):
+                    results.append(dict(size=size, parameters=parameter_count, **result))
+            if classes:
+                for result in bench_parameter_classes(stand_in, memory):
+                    results.append(dict(size=size, parameters=1, **result))
+    return results
+
+def print_results(results:list):
+    header = f"{'scenario':<72} {'size':>7} {'params':>6} {'cache':>5} {'wall ms':>10} {'api calls':>9} {'peak KiB':>10}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        peak = "-" if r["peak_kib"] is None else f"{r['peak_kib']:.1f}"
+        print(f"{r['scenario']:<72} {r['size']:>7} {r['parameters']:>6} {r['cache']:>5} {r['wall_ms']:>10.1f} {r['api_calls']:>9} {peak:>10}")
+
+def main(argv:list=None) -> int:
+    parser = argparse.ArgumentParser(description="benchmark aws_ext against a local stand-in of aws")
+    parser.add_argument("--sizes", default="10,1000", help="comma separated numbers of instances, subnets, ssm parameters and so on")
+    parser.add_argument("--parameters", default="5,50,200", help="comma separated numbers of parameters in templates")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds slept per api call")
+    parser.add_argument("--no-memory", action="store_true", help="do not trace memory, which slows down runs")
+    parser.add_argument("--no-classes", action="store_true", help="skip benchmarks of each parameter class")
+    parser.add_argument("--json", help="path to write results as json")
+    args = parser.parse_args(argv)
+
+    results = run(
+        [int(size) for size in args.sizes.split(",")],
+        [int(count) for count in args.parameters.split(",")],
+        args.latency, not args.no_memory, not args.no_classes,
+    )
+    print_results(results)
+    if args.json is not None:
+        with open(args.json, "w", encoding="utf-8") as fp:
+            json.dump(results, fp, indent=4)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,77 @@
+"""
+benchmark the cost of `%load_ext aws_ext`
+
+- each run imports aws_ext in a fresh interpreter, with IPython already imported as in a kernel
+- fails if the median import time exceeds the budget, or if heavy modules are imported eagerly
+- also reports the cost deferred to the first magic call, importing boto3, ipywidgets and cfn_flip
+
+usage:
+    python benchmarks/bench_import.py --runs 10 --budget-ms 50
+"""
+import os
+import sys
+import json
+import argparse
+import py_compile
+import statistics
+import subprocess
+
+# modules which must not be imported until the first magic call
+DEFERRED_MODULES = ["boto3", "botocore", "ipywidgets", "cfn_flip", "yaml"]
+
+REPOSITORY_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MEASURE_SCRIPT = """
+import sys, json, time
+import IPython
+sys.path.insert(0, {repository_dir!r})
+started = time.perf_counter()
+import aws_ext
+imported = time.perf_counter()
+eager = [name for name in {deferred_modules!r} if name in sys.modules]
+aws_ext.initialize()
+aws_ext.boto3.session, aws_ext.widgets.HTML, aws_ext.cfn_flip.to_json
+deferred = time.perf_counter()
+print(json.dumps(dict(import_ms=(imported - started) * 1000, deferred_ms=(deferred - imported) * 1000, eager=eager)))
+"""
+
+def measure_once() -> dict:
+    script = MEASURE_SCRIPT.format(repository_dir=REPOSITORY_DIR, deferred_modules=DEFERRED_MODULES)
+    out = subprocess.run([sys.executable, "-c", script], check=True, capture_output=True, text=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+def main(argv:list=None) -> int:
+    parser = argparse.ArgumentParser(description="benchmark the import time of aws_ext")
+    parser.add_argument("--runs", type=int, default=10, help="number of fresh interpreters to import aws_ext in")
+    parser.add_argument("--budget-ms", type=float, default=50.0, help="maximum median import time in milliseconds")
+    parser.add_argument("--json", help="path to write results as json")
+    args = parser.parse_args(argv)
+
+    # bytecode is cached as in an installed package, so compiling the source is left out
+    py_compile.compile(os.path.join(REPOSITORY_DIR, "aws_ext.py"), doraise=True)
+    runs = [measure_once() for _ in range(args.runs)]
+    result = dict(
+        import_ms=statistics.median(run["import_ms"] for run in runs),
+        deferred_ms=statistics.median(run["deferred_ms"] for run in runs),
+        eager=sorted({name for run in runs for name in run["eager"]}),
+        budget_ms=args.budget_ms,
+        runs=args.runs,
+    )
+    print(f"import aws_ext            : {result['import_ms']:8.1f} ms (median of {args.runs}, budget {args.budget_ms:.1f} ms)")
+    print(f"deferred to first magic  : {result['deferred_ms']:8.1f} ms")
+    if args.json is not None:
+        with open(args.json, "w", encoding="utf-8") as fp:
+            json.dump(result, fp, indent=4)
+
+    failed = False
+    if len(result["eager"]) > 0:
+        print(f"imported eagerly : {', '.join(result['eager'])}", file=sys.stderr)
+        failed = True
+    if result["import_ms"] > args.budget_ms:
+        print(f"import time exceeds the budget by {result['import_ms'] - args.budget_ms:.1f} ms", file=sys.stderr)
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,86 @@
+"""
+benchmark reading parameters of large yaml templates
+
+- compares parse_template_yaml with the cfn_flip.to_json then json.loads round trip it replaces
+- templates are generated as SAM (Parameters before Resources) and CDK (Resources first) lay them out
+- fails if both ways read different Parameters or Rules sections
+
+usage:
+    python benchmarks/bench_template.py --resources 1000,8000 --runs 3
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import aws_ext
+
+# number of parameters in generated templates
+PARAMETERS = 40
+
+def generate_template(resources:int, layout:str) -> str:
+    parameters = ["Parameters:"]
+    for i in range(PARAMETERS):
+        parameters += [f"  P{i}:", "    Type: String", f"    Default: v{i}", "    Description: generated"]
+    parameters += ["  Vpc:", "    Type: AWS::EC2::VPC::Id", "  Subnet:", "    Type: AWS::EC2::Subnet::Id"]
+    rules = [
+        "Rules:", "  SubnetInVpc:", "    Assertions:",
+        "      - Assert: !Equals [!Ref Vpc, !ValueOf [Subnet, VpcId]]",
+    ]
+    body = ["Resources:"]
+    for i in range(resources):
+        body += [
+            f"  Function{i}:", "    Type: AWS::Lambda::Function", "    Properties:",
+            f"      FunctionName: !Sub '${{AWS::StackName}}-{i}'", "      Role: !GetAtt Role.Arn",
+            "      Environment:", "        Variables:", f"          PARAMETER: !Ref P{i % PARAMETERS}",
+            "          REGION: !Join ['', [region-, !Ref 'AWS::Region']]",
+            "      Code:", "        ZipFile: |", "          def handler(event, context):", "              return event",
+        ]
+    head = ["AWSTemplateFormatVersion: '2010-09-09'", "Description: generated"]
+    sections = parameters + rules + body if layout == "sam" else body + parameters + rules
+    return "\n".join(head + sections) + "\n"
+
+def flip_then_loads(text:str) -> dict:
+    return json.loads(aws_ext.cfn_flip.to_json(text))
+
+def measure(func, text:str, runs:int) -> tuple:
+    durations = []
+    for _ in range(runs):
+        started = perf_counter()
+        template = func(text)
+        durations.append((perf_counter() - started) * 1000)
+    return statistics.median(durations), template
+
+def main(argv:list=None) -> int:
+    parser = argparse.ArgumentParser(description="benchmark reading parameters of large yaml templates")
+    parser.add_argument("--resources", default="1000,8000", help="comma separated numbers of resources in templates")
+    parser.add_argument("--runs", type=int, default=3, help="number of runs per template, the median is reported")
+    parser.add_argument("--json", help="path to write results as json")
+    args = parser.parse_args(argv)
+
+    results = []
+    failed = False
+    print(f"{'layout':<6} {'resources':>9} {'size (KB)':>10} {'flip+loads (ms)':>16} {'sections (ms)':>14} {'speedup':>8}")
+    for resources in [int(n) for n in args.resources.split(",")]:
+        for layout in ("sam", "cdk"):
+            text = generate_template(resources, layout)
+            flip_ms, expected = measure(flip_then_loads, text, args.runs)
+            parse_ms, actual = measure(aws_ext.parse_template_yaml, text, args.runs)
+            same = all(expected.get(section) == actual.get(section) for section in aws_ext.TEMPLATE_SECTIONS)
+            failed = failed or not same
+            results.append(dict(
+                layout=layout, resources=resources, size=len(text), flip_ms=flip_ms, parse_ms=parse_ms, same=same,
+            ))
+            print(f"{layout:<6} {resources:>9} {len(text) / 1024:>10.0f} {flip_ms:>16.1f} {parse_ms:>14.1f} {flip_ms / parse_ms:>7.0f}x"
+                  + ("" if same else "  sections differ"))
+    if args.json is not None:
+        with open(args.json, "w", encoding="utf-8") as fp:
+            json.dump(results, fp, indent=4)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -22,8 +22,8 @@ setup(
         "Programming Language :: Python :: 3.8",
         "Operating System :: OS Independent",
     ],
-    # entry_points = '''
-    #     [console_scripts]
-    #     cfn-docgen=main:main
-    # '''
+    entry_points = '''
+        [console_scripts]
+        aws-cfn-parameters=aws_ext:main
+    '''
 )
\ No newline at end of file